@@ -0,0 +1,82 @@
+"""The following tests cover the number of queries and the pages of the order history."""
+
+import datetime
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from cart.models import Order, Payment, Ticket
+from movies.models import Seat
+from movies.tests import create_movie, create_screen, create_show, create_theater, program
+from .views import ORDERS_PER_PAGE
+
+class MyOrdersViewTests(TestCase):
+    """A page of the order history takes the same queries however long the history."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.program = program(datetime.date.today() + datetime.timedelta(1), 20)
+        screen = create_screen(create_theater(), 'SEAT_1')
+        cls.show = create_show(create_movie(), screen, cls.program)
+        cls.screen_seats = list(Seat.objects.filter(screen=screen).order_by('id'))
+        cls.payment = Payment.objects.create(
+            cc_number='4444333322221111', cc_expiry=datetime.date(2030, 12, 31), cc_code='123')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.seats = list(self.screen_seats)
+
+    def add_orders(self, count, tickets=2):
+        """Adds count orders of the user, each with paid tickets and an unpaid one."""
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, payment=self.payment, total=18)
+            seats = [self.seats.pop() for _ in range(tickets + 1)]
+            Ticket.objects.bulk_create(
+                [Ticket(user=self.user, show=self.show, seat=seat, program=self.program,
+                        paid=True, order=order) for seat in seats[:tickets]]
+                + [Ticket(user=self.user, show=self.show, seat=seats[-1],
+                          program=self.program, paid=False, order=order)])
+
+    def get(self, **params):
+        return self.client.get(reverse('accounts:my-orders'), params)
+
+    def test_queries_do_not_grow_with_the_history(self):
+        """The session, the user, the orders and their tickets: four queries for any page."""
+        self.add_orders(1)
+        with self.assertNumQueries(4):
+            response = self.get()
+        self.assertEqual(len(response.context['orders'][0].paid_tickets), 2)
+
+        self.add_orders(ORDERS_PER_PAGE + 2, tickets=3)
+        with self.assertNumQueries(4):
+            response = self.get()
+        orders = response.context['orders']
+        self.assertEqual(len(orders), ORDERS_PER_PAGE)
+        # Everything the page shows of a ticket was loaded with it.
+        with self.assertNumQueries(0):
+            for order in orders:
+                for ticket in order.paid_tickets:
+                    (ticket.show.movie.name, ticket.show.theater.name, ticket.program.day,
+                     ticket.seat.position)
+
+    def test_pages(self):
+        """Pages go back from the newest order, and the last page has no older link."""
+        self.add_orders(ORDERS_PER_PAGE + 2)
+        newest = list(Order.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+
+        first = self.get()
+        self.assertEqual([order.id for order in first.context['orders']], newest[:ORDERS_PER_PAGE])
+        self.assertEqual(first.context['older'], newest[ORDERS_PER_PAGE - 1])
+
+        with self.assertNumQueries(4):
+            second = self.get(before=first.context['older'])
+        self.assertEqual([order.id for order in second.context['orders']], newest[ORDERS_PER_PAGE:])
+        self.assertIsNone(second.context['older'])
+
+    def test_only_paid_tickets_of_the_user(self):
+        other = User.objects.create_user('other', password='secret')
+        Order.objects.create(user=other, payment=self.payment, total=9)
+        self.add_orders(1)
+        orders = self.get().context['orders']
+        self.assertEqual(len(orders), 1)
+        self.assertTrue(all(ticket.paid for ticket in orders[0].paid_tickets))
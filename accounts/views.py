@@ -9,10 +9,14 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
+from django.db.models import Prefetch
 from cart.models import Order, Ticket
 from .forms import RegisterForm, UpdateForm
 from .decorators import anonymous_required
 
+# Number of orders shown on each page of the order history.
+ORDERS_PER_PAGE = 10
+
 @ anonymous_required(redirect_url='home')
 def register_view(request):
     """
@@ -111,10 +115,21 @@ def update_profile_view(request):
 
 @login_required
 def my_orders_view(request):
-    """View that allows users to view their order history."""
+    """
+    View that allows users to view their order history, newest first, a page at a time.
+    Pages are selected by the id of the last order of the previous page (?before=id),
+    and the paid tickets of the page's orders are loaded with their show, movie, theater,
+    seat and program, so that a page takes the same number of queries however long the history.
+    """
     orders = Order.objects.filter(user=request.user).order_by('-id')
-    tickets = Ticket.objects.filter(
-        user=request.user, paid=True, order__in=orders)
-
-    context = {'orders': orders, 'tickets': tickets}
+    before = request.GET.get('before', '')
+    if before.isdigit():
+        orders = orders.filter(id__lt=int(before))
+    tickets = Ticket.objects.filter(paid=True).select_related(
+        'show__movie', 'show__theater', 'seat', 'program').order_by('id')
+    orders = list(orders.prefetch_related(
+        Prefetch('ticket_set', queryset=tickets, to_attr='paid_tickets'))[:ORDERS_PER_PAGE + 1])
+
+    older = orders[ORDERS_PER_PAGE - 1].id if len(orders) > ORDERS_PER_PAGE else None
+    context = {'orders': orders[:ORDERS_PER_PAGE], 'older': older, 'paged': before.isdigit()}
     return render(request, 'accounts/my_orders.html', context)
@@ -0,0 +1,193 @@
+"""
+The following classes and functions keep track of a user's booking and book the tickets
+of the seats the user chose. The choices of the booking funnel are kept in the session
+as one BookingContext, with the show resolved once when the date is chosen.
+The tickets are created with one bulk insert and kept as an OrderDraft of the context,
+so that the payment can settle it without looking them up again.
+"""
+
+from decimal import Decimal
+from movies.models import Seat, Show
+from movies.seatmap import parse_position, format_position
+from .models import Ticket, Order, new_order_key
+from .reservations import confirm_seats
+
+SESSION_KEY = 'booking'
+
+class HoldExpired(Exception):
+    """Raised when some tickets of a draft were released before they were paid for."""
+
+class SettlementInProgress(Exception):
+    """Raised when the tickets of a draft are being paid for by another request, e.g. a double submit."""
+
+class OrderDraft:
+    """
+    The unpaid tickets of a booking: their show, program, seats and total price,
+    and the key that identifies the order they will be paid with.
+    """
+
+    def __init__(self, show_id, program_id, seat_ids, positions, total, key=None):
+        self.show_id = show_id
+        self.program_id = program_id
+        self.seat_ids = list(seat_ids)
+        self.positions = list(positions)
+        self.total = Decimal(total)
+        self.key = key or new_order_key()
+
+    def as_dict(self):
+        """Returns the draft as a dict that can be stored in the session."""
+        return {
+            'show_id': self.show_id,
+            'program_id': self.program_id,
+            'seat_ids': self.seat_ids,
+            'positions': self.positions,
+            'total': str(self.total),
+            'key': self.key,
+        }
+
+class BookingContext:
+    """
+    The movie, theater and program a user chose in the booking funnel, the show, screen
+    and seating pattern they resolve to, and the OrderDraft of the booked tickets.
+    It is stored in the session under a single key.
+    """
+
+    def __init__(self, movie_id=None, theater_id=None, program_id=None, show_id=None,
+                 screen_id=None, seating_pattern=None, draft=None):
+        self.movie_id = movie_id
+        self.theater_id = theater_id
+        self.program_id = program_id
+        self.show_id = show_id
+        self.screen_id = screen_id
+        self.seating_pattern = seating_pattern
+        self.draft = OrderDraft(**draft) if draft else None
+
+    @classmethod
+    def load(cls, session):
+        """Returns the context stored in the session, or an empty one."""
+        return cls(**session.get(SESSION_KEY, {}))
+
+    def save(self, session):
+        """Stores the context in the session."""
+        session[SESSION_KEY] = {
+            'movie_id': self.movie_id,
+            'theater_id': self.theater_id,
+            'program_id': self.program_id,
+            'show_id': self.show_id,
+            'screen_id': self.screen_id,
+            'seating_pattern': self.seating_pattern,
+            'draft': self.draft.as_dict() if self.draft else None,
+        }
+
+    def _forget_show(self):
+        self.program_id = None
+        self.show_id = None
+        self.screen_id = None
+        self.seating_pattern = None
+        self.draft = None
+
+    def choose_movie(self, movie_id):
+        """Sets the movie, forgetting the choices that depend on it."""
+        self.movie_id = movie_id
+        self.theater_id = None
+        self._forget_show()
+
+    def choose_theater(self, theater_id):
+        """Sets the theater, forgetting the choices that depend on it."""
+        self.theater_id = theater_id
+        self._forget_show()
+
+    def choose_program(self, program_id):
+        """
+        Sets the program and resolves the show of the chosen movie and theater played at it,
+        with its screen and seating pattern. Returns whether such a show exists.
+        """
+        show = Show.objects.filter(
+            movie_id=self.movie_id, theater_id=self.theater_id, program__id=program_id
+        ).values_list('id', 'screen_id', 'screen__seating_pattern').first()
+        self._forget_show()
+        if show is None:
+            return False
+        self.program_id = program_id
+        self.show_id, self.screen_id, self.seating_pattern = show
+        return True
+
+def book_tickets(user, show, program_id, positions):
+    """
+    Creates the unpaid tickets of a user for the seats at the given positions of a show's
+    program and returns their OrderDraft. The seats are loaded with one query and the
+    tickets are created with one bulk insert. The seats must have been held beforehand.
+    """
+    positions = sorted({format_position(*parse_position(position)) for position in positions})
+    seats = Seat.objects.filter(
+        screen_id=show.screen_id, position__in=positions).values_list('position', 'id')
+    seat_ids = dict(seats)
+
+    tickets = [
+        Ticket(user=user, show=show, program_id=program_id, seat_id=seat_ids[position])
+        for position in positions
+    ]
+    Ticket.objects.bulk_create(tickets)
+    return OrderDraft(show.id, program_id, [ticket.seat_id for ticket in tickets],
+                      positions, show.price * len(tickets))
+
+def settle(user, draft, payment_form):
+    """
+    Pays for the tickets of a draft. The tickets are claimed first, by marking them as paid
+    with one conditional update each, in the order of their ids, and the payment and the order
+    are only saved once all of them were claimed. Since djongo cannot roll back a transaction,
+    a step that fails undoes the previous ones itself, only for the tickets this call claimed,
+    so that no payment or order is left without its tickets.
+    Returns the order and whether it was created by this call; an order that was already
+    created with the draft's key, e.g. by a form submitted twice, is returned as it is.
+    Raises SettlementInProgress if the tickets are claimed by another payment of the draft
+    that has not created its order yet, and HoldExpired, without paying for anything,
+    if some tickets were released meanwhile.
+    """
+    order = Order.objects.filter(user=user, idempotency_key=draft.key).first()
+    if order is not None:
+        # The seats of an order whose settlement stopped after it was created are reserved now.
+        confirm_seats(draft.show_id, draft.program_id, draft.positions)
+        return order, False
+
+    tickets = Ticket.objects.filter(
+        user=user, show_id=draft.show_id, program_id=draft.program_id,
+        seat_id__in=draft.seat_ids)
+    ticket_ids = sorted(tickets.values_list('id', flat=True))
+    # Payments of the same draft claim the tickets in the same order, so the one that
+    # loses the first ticket stops there and the other one claims them all.
+    claimed = []
+    for ticket_id in ticket_ids:
+        if not Ticket.objects.filter(id=ticket_id, paid=False).update(paid=True):
+            break
+        claimed.append(ticket_id)
+    tickets = Ticket.objects.filter(id__in=claimed)
+    if len(claimed) != len(draft.seat_ids):
+        tickets.filter(order=None).update(paid=False)
+        # The tickets may have been claimed by the same form submitted twice.
+        order = Order.objects.filter(user=user, idempotency_key=draft.key).first()
+        if order is not None:
+            return order, False
+        # Tickets that are all still there were claimed by another payment of the draft.
+        if not claimed and Ticket.objects.filter(id__in=ticket_ids).count() == len(draft.seat_ids):
+            raise SettlementInProgress()
+        raise HoldExpired()
+
+    payment = order = None
+    try:
+        payment = payment_form.save()
+        order = Order.objects.create(
+            user=user, payment=payment, total=draft.total, idempotency_key=draft.key)
+        # Tickets of an expired hold may have been deleted since they were claimed.
+        if tickets.filter(order=None).update(order=order) != len(draft.seat_ids):
+            raise HoldExpired()
+    except Exception:
+        if order is not None:
+            tickets.filter(order=order).update(order=None)
+            order.delete()
+        if payment is not None:
+            payment.delete()
+        tickets.filter(order=None).update(paid=False)
+        raise
+    confirm_seats(draft.show_id, draft.program_id, draft.positions)
+    return order, True
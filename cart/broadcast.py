@@ -0,0 +1,134 @@
+"""
+The following classes and functions push the changes of a show's seat map to the open
+seat pages. Every change is published once on the channel of its (show, program) and
+fanned out to the subscribers of that channel, so open pages never query the database.
+The broadcaster is chosen with the SEAT_BROADCASTER setting. LocalBroadcaster keeps the
+subscribers in memory and only reaches the pages served by the same process; a shared
+broadcaster, e.g. on Redis pub/sub, can be plugged in with the same interface.
+"""
+
+import json
+import queue
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+def channel(show_id, program_id):
+    """Returns the name of the channel of a show's program."""
+    return f"seats:{show_id}:{program_id}"
+
+class Subscription:
+    """The messages of a channel waiting to be sent to one subscriber."""
+
+    def __init__(self, name, maxsize):
+        self.channel = name
+        self.messages = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, message):
+        """Queues a message; a subscriber that does not keep up is marked as overflowed."""
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Returns the next message, or None if none arrived within timeout seconds."""
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class LocalBroadcaster:
+    """In-memory fan-out, with a bounded queue per subscriber."""
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, name, limit=None):
+        """
+        Returns a new Subscription to a channel, or None if limit subscriptions of all channels
+        are open already. The slot is taken under the same lock as the count, so that
+        subscriptions made at the same time never go past the limit.
+        """
+        subscription = Subscription(name, self.maxsize)
+        with self._lock:
+            if limit is not None and sum(map(len, self._subscribers.values())) >= limit:
+                return None
+            self._subscribers[name].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stops sending messages to a subscription."""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, name, message):
+        """Sends a message to every subscriber of a channel."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(name, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribers(self, name=None):
+        """Returns the number of subscribers of a channel, or of all channels."""
+        with self._lock:
+            if name is not None:
+                return len(self._subscribers.get(name, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+def broadcaster():
+    """Returns the broadcaster of this process, created from the SEAT_BROADCASTER setting."""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = import_string(settings.SEAT_BROADCASTER)()
+        return _broadcaster
+
+def publish_seats(show_id, program_id, version, changes):
+    """Publishes the {(row, col): state} changes that moved a seat map to the given version."""
+    broadcaster().publish(channel(show_id, program_id), {
+        'version': version,
+        'seats': [[row, col, state] for (row, col), state in sorted(changes.items())],
+    })
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+class SeatEvents:
+    """
+    The server-sent events of a seat page: a snapshot of the seat states, then the changes
+    published on its channel. A comment is sent every keepalive seconds without changes,
+    so that closed connections are noticed. The subscription ends when the response is closed.
+    """
+
+    def __init__(self, subscription, states, keepalive=15):
+        self.subscription = subscription
+        self.states = states
+        self.keepalive = keepalive
+
+    def __iter__(self):
+        yield _event('snapshot', {'version': self.states['version'],
+                                  'seats': self.states['seats']})
+        # A subscriber whose queue overflowed has missed changes, so its stream is ended
+        # and the page reconnects to get a new snapshot.
+        while not self.subscription.overflowed:
+            message = self.subscription.get(timeout=self.keepalive)
+            if message is None:
+                yield ': keepalive\n\n'
+            else:
+                yield _event('seats', message)
+
+    def close(self):
+        """Unsubscribes from the channel."""
+        broadcaster().unsubscribe(self.subscription)
@@ -3,32 +3,39 @@ The following forms are related to cart handling, and
 are used for selecting movies, theaters, dates and ticket payment.
 """
 
-from datetime import datetime, timedelta
 from django import forms
-from movies.models import Show, Movie, Theater, Program
+from django.utils import timezone
+from movies import catalog, typeahead
+from movies.models import Movie, Theater, Program
 from .models import Payment
+from .widgets import TypeaheadWidget
 
 class ChooseMovieForm(forms.Form):
     """
     Allows users to select a movie they want to book tickets for,
-    from a list including movies played at that time and up to 1 week after.
+    among the movies played at that time and up to 1 week after.
+    The movies are suggested while the user types their name,
+    so the form does not render them all.
     """
 
-    now = datetime.now()
-    today = now.date()
-    next_week = today + timedelta(7)
-    current_shows = Show.objects.filter(
-        program__day__gte=today, program__day__lte=next_week).values('movie')
-    current_movies = Movie.objects.filter(id__in=current_shows)
-    movie = forms.ModelChoiceField(queryset=current_movies)
+    movie = forms.ModelChoiceField(
+        queryset=Movie.objects.none(),
+        widget=TypeaheadWidget('cart:movie-suggestions', typeahead.movies.label))
+
+    def __init__(self, *args, **kwargs):
+        super(ChooseMovieForm, self).__init__(*args, **kwargs)
+        self.fields['movie'].queryset = catalog.now_showing(timezone.localdate())
 
 class ChooseTheaterForm(forms.Form):
     """
     Allows users to select a theater of their choice
-    where they want to watch a movie at.
+    where they want to watch a movie at. The theaters are suggested
+    while the user types their name, city or county.
     """
 
-    theater = forms.ModelChoiceField(queryset=Theater.objects.none())
+    theater = forms.ModelChoiceField(
+        queryset=Theater.objects.none(),
+        widget=TypeaheadWidget('cart:theater-suggestions', typeahead.theaters.label))
 
     def __init__(self, *args, **kwargs):
         qs = kwargs.pop('qs')
@@ -48,7 +55,11 @@ class PaymentForm(forms.ModelForm):
     """
     Allows users to pay for their booked ticket by entering
     their card's cc number, expiration date and security code.
+    The hidden idempotency key identifies the order, so that submitting
+    the form twice does not pay for the same tickets twice.
     """
+    idempotency_key = forms.CharField(widget=forms.HiddenInput, required=False)
+
     class Meta:
         model = Payment
         fields = ['cc_number', 'cc_expiry', 'cc_code',]
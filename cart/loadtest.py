@@ -0,0 +1,213 @@
+"""
+The following functions and classes load test the booking funnel. seed_catalog creates
+theaters, screens, movies, shows and programs, and VirtualUser walks through the
+choose movie, theater, date and seat pages and the payment with the Django test client,
+recording the latency and the number of queries of every request.
+"""
+
+import time
+import random
+import datetime
+import threading
+from collections import Counter, defaultdict
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from movies.models import Movie, Theater, Screen, Show, Program, Seat
+from movies.seatmap import parse_position
+from .models import Ticket, Order, Payment
+
+NAME = 'Load test'
+
+class Catalog:
+    """The objects created by seed_catalog, and the bookable (movie, theater, program) choices."""
+
+    def __init__(self):
+        self.theaters = []
+        self.movies = []
+        self.programs = []
+        self.users = []
+        self.choices = []
+        self.positions = {}
+
+    def delete(self):
+        """Deletes everything that was created for the load test, including orders and payments."""
+        payments = Order.objects.filter(user__in=self.users).values_list('payment_id', flat=True)
+        Payment.objects.filter(id__in=list(payments)).delete()
+        User.objects.filter(id__in=[user.id for user in self.users]).delete()
+        Theater.objects.filter(id__in=[theater.id for theater in self.theaters]).delete()
+        Movie.objects.filter(id__in=[movie.id for movie in self.movies]).delete()
+        Program.objects.filter(id__in=[program.id for program in self.programs]).delete()
+
+def seed_catalog(theaters=2, screens=2, movies=4, days=3, shows_per_day=3,
+                 seating_pattern='SEAT_1', users=10):
+    """
+    Creates a catalog where every screen plays a movie shows_per_day times a day,
+    for the given number of days starting today, and the users that will book tickets.
+    """
+    catalog = Catalog()
+    today = datetime.date.today()
+    catalog.movies = [
+        Movie.objects.create(
+            name=f"{NAME} {number}", description=NAME, year=2000, rating=5,
+            duration=90, director=NAME, cast=NAME)
+        for number in range(movies)
+    ]
+    catalog.programs = [
+        Program.objects.create(
+            day=today + datetime.timedelta(day), hour=datetime.time(12 + 3*show))
+        for day in range(days) for show in range(shows_per_day)
+    ]
+    for number in range(theaters):
+        theater = Theater.objects.create(
+            name=f"{NAME} {number}", city=NAME, county='Νομός Αττικής',
+            address=NAME, zipcode='00000')
+        catalog.theaters.append(theater)
+        for screen_number in range(screens):
+            screen = Screen.objects.create(
+                name=f"{NAME} {screen_number}", no_rows=0, no_cols=0, no_seats=0,
+                seating_pattern=seating_pattern, theater=theater)
+            movie = catalog.movies[(number*screens + screen_number) % movies]
+            show = Show.objects.create(movie=movie, theater=theater, screen=screen, price=8)
+            show.program.add(*catalog.programs)
+            catalog.positions[show.id] = list(
+                Seat.objects.filter(screen=screen).values_list('position', flat=True))
+            catalog.choices.extend(
+                (show.id, movie.id, theater.id, program.id) for program in catalog.programs)
+
+    catalog.users = [
+        User.objects.create_user(f"loadtest-{number}-{random.getrandbits(32)}")
+        for number in range(users)
+    ]
+    return catalog
+
+class Recorder:
+    """Collects the latency, query count and outcome of every request, per view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = Counter()
+        self.conflicts = 0
+        self.bookings = 0
+
+    def record(self, view, elapsed, queries, error=False):
+        with self.lock:
+            self.latencies[view].append(elapsed)
+            self.queries[view].append(queries)
+            if error:
+                self.errors[view] = self.errors[view] + 1
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summary(recorder):
+    """Returns the number of requests and errors, the latency percentiles and the mean queries of every view."""
+    views = {}
+    for view in sorted(recorder.latencies):
+        latencies = recorder.latencies[view]
+        queries = recorder.queries[view]
+        views[view] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[view],
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'queries': sum(queries) / len(queries),
+        }
+    return views
+
+def seat_label(position):
+    """Returns a seat position in the form the seat page posts it."""
+    return '{},{}'.format(*parse_position(position))
+
+class VirtualUser:
+    """A logged in user that books tickets through the funnel, one request after the other."""
+
+    def __init__(self, user, catalog, recorder, seats=2):
+        self.client = Client(SERVER_NAME='127.0.0.1')
+        self.client.force_login(user)
+        self.catalog = catalog
+        self.recorder = recorder
+        self.seats = seats
+
+    def request(self, method, view, data=None):
+        """Sends a request to a view, and records its latency and number of queries."""
+        send = self.client.post if method == 'POST' else self.client.get
+        error = False
+        response = None
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                response = send(reverse(view), data)
+                error = response.status_code >= 400
+            except Exception:
+                error = True
+        self.recorder.record(f"{method} {view}", time.perf_counter() - start,
+                             len(queries), error)
+        return response
+
+    def book(self):
+        """Walks through the funnel once, for a random show and random seats."""
+        show_id, movie_id, theater_id, program_id = random.choice(self.catalog.choices)
+        self.request('GET', 'cart:choose-movie')
+        self.request('POST', 'cart:choose-movie', {'movie': movie_id})
+        self.request('GET', 'cart:choose-theater')
+        self.request('POST', 'cart:choose-theater', {'theater': theater_id})
+        self.request('GET', 'cart:choose-date')
+        self.request('POST', 'cart:choose-date', {'date': program_id})
+        self.request('GET', 'cart:choose-seat')
+
+        seats = [seat_label(position)
+                 for position in random.sample(self.catalog.positions[show_id], self.seats)]
+        response = self.request('POST', 'cart:choose-seat', {'seat': seats})
+        if response is None:
+            return
+        if response.get('Location', '') != reverse('cart:payment'):
+            self.recorder.count('conflicts')
+            return
+
+        self.request('GET', 'cart:payment')
+        expiry = datetime.date.today() + datetime.timedelta(365)
+        self.request('POST', 'cart:payment', {
+            'cc_number': '4444333322221111',
+            'cc_expiry': expiry.strftime('%m/%y'),
+            'cc_code': '123',
+        })
+        self.request('GET', 'cart:my-tickets')
+        self.recorder.count('bookings')
+
+    def run(self, iterations):
+        """Books tickets the given number of times, and closes the thread's database connection."""
+        try:
+            for _ in range(iterations):
+                self.book()
+        finally:
+            connection.close()
+
+def run(catalog, iterations=5, seats=2):
+    """Runs one virtual user per catalog user concurrently, and returns their Recorder."""
+    recorder = Recorder()
+    users = [VirtualUser(user, catalog, recorder, seats) for user in catalog.users]
+    threads = [threading.Thread(target=user.run, args=(iterations,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+def double_bookings(catalog):
+    """Returns the (show, program, seat) triples of the catalog that have more than one ticket."""
+    shows = {show_id for show_id, _, _, _ in catalog.choices}
+    tickets = Counter(Ticket.objects.filter(show_id__in=shows).values_list(
+        'show_id', 'program_id', 'seat_id'))
+    return [booking for booking, count in tickets.items() if count > 1]
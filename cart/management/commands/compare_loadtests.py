@@ -0,0 +1,42 @@
+"""
+Compares the JSON reports written by loadtest --json, e.g. for runs with different
+DB_BACKEND settings, and prints the latency of every view side by side.
+"""
+
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    """Prints the p50 and p95 latency of every view for each report."""
+    help = 'Compares the per-view latency of loadtest JSON reports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('reports', nargs='+', metavar='FILE',
+                            help='JSON reports written by loadtest --json.')
+
+    def handle(self, *args, **options):
+        reports = []
+        for path in options['reports']:
+            try:
+                with open(path) as report:
+                    reports.append(json.load(report))
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read {path}: {error}")
+
+        views = sorted({view for report in reports for view in report['views']})
+        header = f"{'view':<28}" + ''.join(
+            f"{report['label'] + ' p50':>18}{'p95':>9}" for report in reports)
+        self.stdout.write(header)
+        for view in views:
+            line = f"{view:<28}"
+            for report in reports:
+                stats = report['views'].get(view)
+                if stats is None:
+                    line = line + f"{'-':>18}{'-':>9}"
+                else:
+                    line = line + f"{stats['p50']*1000:>18.1f}{stats['p95']*1000:>9.1f}"
+            self.stdout.write(line)
+        self.stdout.write(f"{'total s':<28}" + ''.join(
+            f"{report['elapsed']:>18.1f}{'':>9}" for report in reports))
+        self.stdout.write(f"{'bookings':<28}" + ''.join(
+            f"{report['bookings']:>18}{'':>9}" for report in reports))
@@ -0,0 +1,84 @@
+"""
+Replays the booking funnel with concurrent virtual users against a seeded catalog,
+and reports the latency and queries of every view and any seat booked twice.
+The report can also be written as JSON, to compare backends with compare_loadtests.
+"""
+
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from cart import loadtest
+
+class Command(BaseCommand):
+    """Seeds a catalog, runs the virtual users and prints a report per view."""
+    help = 'Load tests the booking funnel with concurrent virtual users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10,
+                            help='Number of concurrent virtual users.')
+        parser.add_argument('--iterations', type=int, default=5,
+                            help='Number of bookings each user attempts.')
+        parser.add_argument('--seats', type=int, default=2,
+                            help='Number of seats in each booking.')
+        parser.add_argument('--theaters', type=int, default=2)
+        parser.add_argument('--screens', type=int, default=2,
+                            help='Number of screens per theater.')
+        parser.add_argument('--movies', type=int, default=4)
+        parser.add_argument('--days', type=int, default=3,
+                            help='Number of days with shows, starting today.')
+        parser.add_argument('--shows-per-day', type=int, default=3)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded catalog and bookings afterwards.')
+        parser.add_argument('--json', metavar='FILE',
+                            help='Also write the report as JSON to FILE.')
+        parser.add_argument('--label',
+                            help='Name of the run in the JSON report, DB_BACKEND by default.')
+
+    def handle(self, *args, **options):
+        catalog = loadtest.seed_catalog(
+            theaters=options['theaters'], screens=options['screens'],
+            movies=options['movies'], days=options['days'],
+            shows_per_day=options['shows_per_day'], users=options['users'])
+        try:
+            start = time.perf_counter()
+            recorder = loadtest.run(catalog, options['iterations'], options['seats'])
+            elapsed = time.perf_counter() - start
+            violations = loadtest.double_bookings(catalog)
+        finally:
+            if not options['keep']:
+                catalog.delete()
+
+        views = loadtest.summary(recorder)
+        self.stdout.write(f"Backend: {settings.DB_BACKEND} ({connection.vendor})")
+        self.stdout.write(
+            f"{'view':<28}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'queries':>9}")
+        for view, stats in views.items():
+            self.stdout.write(
+                f"{view:<28}{stats['requests']:>9}{stats['errors']:>8}"
+                f"{stats['p50']*1000:>9.1f}{stats['p95']*1000:>9.1f}"
+                f"{stats['p99']*1000:>9.1f}{stats['queries']:>9.1f}")
+        self.stdout.write(
+            f"{recorder.bookings} bookings, {recorder.conflicts} seat conflicts "
+            f"in {elapsed:.1f}s, {len(violations)} seats booked twice")
+
+        if options['json']:
+            report = {
+                'label': options['label'] or settings.DB_BACKEND,
+                'vendor': connection.vendor,
+                'options': {name: options[name] for name in (
+                    'users', 'iterations', 'seats', 'theaters', 'screens',
+                    'movies', 'days', 'shows_per_day')},
+                'elapsed': elapsed,
+                'bookings': recorder.bookings,
+                'conflicts': recorder.conflicts,
+                'double_bookings': len(violations),
+                'views': views,
+            }
+            with open(options['json'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if violations:
+            raise CommandError(f"Seats booked more than once: {violations}")
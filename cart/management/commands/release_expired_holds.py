@@ -0,0 +1,21 @@
+"""Releases the seats whose hold expired before the user paid for them."""
+
+import time
+from django.core.management.base import BaseCommand
+from cart.reservations import release_expired_holds
+
+class Command(BaseCommand):
+    """Runs the expired hold sweeper once, or every few seconds with --every."""
+    help = 'Makes seats with expired holds available and deletes their unpaid tickets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running and sweep every that many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds()
+            self.stdout.write(f"Released {released} seats with expired holds.")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
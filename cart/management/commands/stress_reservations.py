@@ -0,0 +1,85 @@
+"""
+Runs many threads that try to hold overlapping seats of the same show at the same time,
+and checks that no seat was given to more than one of them.
+"""
+
+import random
+import datetime
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from movies.models import Movie, Theater, Screen, Show, Program, ShowSeat, SeatMap
+from movies.seatmap import UNAVAILABLE
+from movies.seating_patterns import LAYOUTS
+from cart.reservations import hold_seats
+
+class Command(BaseCommand):
+    """Creates a throwaway show and lets concurrent buyers compete for its seats."""
+    help = 'Stress tests seat holds with concurrent buyers on the same show.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Number of concurrent buyers.')
+        parser.add_argument('--attempts', type=int, default=20,
+                            help='Number of holds each buyer attempts.')
+        parser.add_argument('--seats', type=int, default=4,
+                            help='Number of seats in each hold.')
+
+    def handle(self, *args, **options):
+        theater = Theater.objects.create(
+            name='Stress test', city='Stress test', county='Νομός Αττικής',
+            address='Stress test', zipcode='00000')
+        movie = Movie.objects.create(
+            name='Stress test', description='Stress test', year=2000,
+            rating=5, duration=120, director='Stress test', cast='Stress test')
+        program = Program.objects.create(day=datetime.date.today(), hour=datetime.time(20))
+        try:
+            screen = Screen.objects.create(
+                name='Stress test', no_rows=0, no_cols=0, no_seats=0,
+                seating_pattern='SEAT_2', theater=theater)
+            show = Show.objects.create(movie=movie, theater=theater, screen=screen, price=9)
+            show.program.add(program)
+            self.run_buyers(show, program, options)
+        finally:
+            theater.delete()
+            movie.delete()
+            program.delete()
+
+    def run_buyers(self, show, program, options):
+        """Starts the buyer threads and checks the seats they were given."""
+        positions = LAYOUTS[show.screen.seating_pattern].positions
+        claimed = []
+        failed = []
+        lock = threading.Lock()
+
+        def buyer():
+            try:
+                for _ in range(options['attempts']):
+                    wanted = random.sample(positions, options['seats'])
+                    if not hold_seats(show, program.id, wanted):
+                        with lock:
+                            claimed.extend(wanted)
+                    else:
+                        with lock:
+                            failed.append(wanted)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seat_map = SeatMap.objects.get(show=show, program=program)
+        held = ShowSeat.objects.filter(show=show, program=program, status=UNAVAILABLE).count()
+        self.stdout.write(
+            f"{len(claimed)} seats claimed, {len(failed)} holds rejected, "
+            f"{seat_map.count(UNAVAILABLE)} seats unavailable in the seat map, "
+            f"{held} in ShowSeat")
+
+        if len(claimed) != len(set(claimed)):
+            raise CommandError('A seat was claimed by more than one buyer.')
+        if not len(claimed) == seat_map.count(UNAVAILABLE) == held:
+            raise CommandError('The seat map and the ShowSeat entries disagree.')
+        self.stdout.write('No seat was claimed twice.')
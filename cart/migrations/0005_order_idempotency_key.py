@@ -0,0 +1,36 @@
+# Generated by Django 2.1.5 on 2026-10-18 12:00
+
+import uuid
+from django.db import migrations, models
+import cart.models
+
+
+def fill_idempotency_keys(apps, schema_editor):
+    """
+    Gives every existing order its own key before the keys are made unique,
+    since a unique index does not accept several orders without a key on MongoDB.
+    """
+    Order = apps.get_model('cart', 'Order')
+    for order in Order.objects.filter(idempotency_key__isnull=True).only('id'):
+        Order.objects.filter(pk=order.pk).update(idempotency_key=uuid.uuid4().hex)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_auto_20200414_1457'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.RunPython(fill_idempotency_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(default=cart.models.new_order_key, max_length=32, unique=True),
+        ),
+    ]
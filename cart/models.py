@@ -1,4 +1,5 @@
 """The following models are related to cart."""
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
@@ -6,6 +7,10 @@ from creditcards import types
 from creditcards.models import CardNumberField, CardExpiryField, SecurityCodeField
 from movies.models import Show, Seat, Program
 
+def new_order_key():
+    """Returns a random idempotency key for a new order."""
+    return uuid.uuid4().hex
+
 class Payment(models.Model):
     """Stores payment info"""
     cc_number = CardNumberField(_('card number'))
@@ -22,6 +27,10 @@ class Order(models.Model):
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE)
     total = models.DecimalField(max_digits=4, decimal_places=2, blank=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    idempotency_key = models.CharField(max_length=32, unique=True, default=new_order_key)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-id'], name='order_user_id_idx')]
 
 class Ticket(models.Model):
     """Stores info about booked tickets"""
@@ -30,7 +39,12 @@ class Ticket(models.Model):
     seat = models.ForeignKey(Seat, on_delete=models.CASCADE)
     program = models.ForeignKey(Program, on_delete=models.CASCADE)
     paid = models.BooleanField(default=False)
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'show', 'program', 'paid'], name='ticket_user_show_idx'),
+        ]
 
     def __str__(self):
         return ('Show:'+str(self.show)+'  '+'Date'+str(self.program)+
@@ -0,0 +1,152 @@
+"""
+The following functions claim the seats of a show's program for a buyer,
+confirm them after payment and release the holds that have expired.
+The SeatMap of the program decides who gets a seat, since it is changed with
+a single conditional update, and the ShowSeat entries are updated to mirror it.
+A hold writes the expiry of its ShowSeat entries first, so that a hold that fails
+between the two writes is still released when it expires.
+Every change of a seat map is published to the open seat pages once it is committed.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from movies.models import ShowSeat, SeatMap
+from movies.seatmap import AVAILABLE, RESERVED, UNAVAILABLE, parse_position, format_position
+from .models import Ticket
+from .broadcast import publish_seats
+from . import seatcache
+
+def _update_seats(seat_map, changes, expected):
+    """
+    Changes the seats of a seat map like SeatMap.update_seats, and once the change
+    is committed drops the cached seat states and publishes the changes.
+    """
+    conflicts = seat_map.update_seats(changes, expected=expected)
+    if not conflicts:
+        show_id, program_id, version = seat_map.show_id, seat_map.program_id, seat_map.version
+
+        def changed():
+            seatcache.invalidate(show_id, program_id, version)
+            publish_seats(show_id, program_id, version, changes)
+
+        transaction.on_commit(changed)
+    return conflicts
+
+def _coordinates(seat_map, positions):
+    """
+    Splits position strings into the (row, col) tuples that exist in the seat map
+    and the positions that do not.
+    """
+    coordinates, invalid = set(), []
+    for position in positions:
+        try:
+            row, col = parse_position(position)
+        except ValueError:
+            invalid.append(position)
+            continue
+        if 1 <= row <= seat_map.rows and 1 <= col <= seat_map.cols:
+            coordinates.add((row, col))
+        else:
+            invalid.append(position)
+    return coordinates, invalid
+
+def hold_seats(show, program_id, positions):
+    """
+    Claims the seats at the given positions for a show's program, all or nothing.
+    The show may be given as a Show or as its id.
+    Returns the positions that could not be claimed because they are taken or do not exist,
+    which is empty when all the seats were claimed.
+    """
+    seat_map = SeatMap.objects.for_show(show, program_id)
+    coordinates, invalid = _coordinates(seat_map, positions)
+    if invalid or not coordinates:
+        return invalid
+
+    show_seats = ShowSeat.objects.filter(
+        show=show,
+        program_id=program_id,
+        position__in=[format_position(row, col) for row, col in coordinates]
+    )
+    expires = timezone.now() + timedelta(minutes=settings.SEAT_HOLD_MINUTES)
+    # The expiry is written before the seat map is changed, so that if the hold stops
+    # half way, release_expired_holds still finds the seats and makes them available again.
+    show_seats.filter(status=AVAILABLE).update(hold_expires=expires)
+
+    conflicts = _update_seats(
+        seat_map, {coordinate: UNAVAILABLE for coordinate in coordinates}, AVAILABLE)
+    if conflicts:
+        show_seats.filter(status=AVAILABLE, hold_expires=expires).update(hold_expires=None)
+        return [format_position(row, col) for row, col in sorted(conflicts)]
+
+    show_seats.update(status=UNAVAILABLE, hold_expires=expires)
+    return []
+
+def _change_held_seats(seat_map, coordinates, state):
+    """
+    Moves the seats of the seat map that are still held to the given state.
+    Seats that are no longer held, e.g. because they were confirmed meanwhile, are left as they are.
+    """
+    while True:
+        bitmap = seat_map.bitmap
+        held = [coordinate for coordinate in coordinates
+                if bitmap.get(*coordinate) == UNAVAILABLE]
+        if not held or not _update_seats(
+                seat_map, {coordinate: state for coordinate in held}, UNAVAILABLE):
+            return
+
+def confirm_seats(show, program_id, positions):
+    """
+    Marks held seats as reserved once they have been paid for, so that their holds never expire.
+    The show may be given as a Show or as its id.
+    """
+    seat_map = SeatMap.objects.for_show(show, program_id)
+    coordinates, _ = _coordinates(seat_map, positions)
+    _change_held_seats(seat_map, coordinates, RESERVED)
+    ShowSeat.objects.filter(
+        show=show,
+        program_id=program_id,
+        position__in=[format_position(row, col) for row, col in coordinates]
+    ).update(status=RESERVED, hold_expires=None)
+
+def release_expired_holds(now=None):
+    """
+    Makes the seats whose hold has expired available again and deletes the unpaid tickets
+    that were booked for them. Seats whose tickets already have an order are left to their
+    payment, which confirms them. The expired holds are found through the index on
+    ShowSeat.hold_expires. Returns the number of seats that were released.
+    """
+    now = now or timezone.now()
+    expired = ShowSeat.objects.filter(hold_expires__lte=now).values_list(
+        'id', 'show_id', 'program_id', 'seat_id', 'position')
+
+    holds = defaultdict(list)
+    for show_seat_id, show_id, program_id, seat_id, position in expired:
+        holds[(show_id, program_id)].append((show_seat_id, seat_id, position))
+
+    released = 0
+    for (show_id, program_id), seats in holds.items():
+        tickets = Ticket.objects.filter(
+            show_id=show_id, program_id=program_id, seat_id__in=[seat_id for _, seat_id, _ in seats])
+        # The unpaid tickets are deleted while the seats are still held,
+        # so that tickets booked after the seats are released are not touched.
+        # Tickets claimed by a payment that never created its order count as unpaid.
+        tickets.filter(Q(paid=False) | Q(order=None)).delete()
+        # The seats of the tickets that have an order are being confirmed by their payment.
+        sold = set(tickets.exclude(order=None).values_list('seat_id', flat=True))
+        seats = [seat for seat in seats if seat[1] not in sold]
+        if not seats:
+            continue
+        released = released + ShowSeat.objects.filter(
+            id__in=[show_seat_id for show_seat_id, _, _ in seats],
+            hold_expires__lte=now
+        ).update(status=AVAILABLE, hold_expires=None)
+
+        seat_map = SeatMap.objects.filter(show_id=show_id, program_id=program_id).first()
+        if seat_map is not None:
+            coordinates, _ = _coordinates(seat_map, [position for _, _, position in seats])
+            _change_held_seats(seat_map, coordinates, AVAILABLE)
+    return released
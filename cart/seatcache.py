@@ -0,0 +1,52 @@
+"""
+The following functions cache the seat states of a show's program, with the version
+of its seat map, so that seat pages can check for changes without a database query.
+The states are cached under their version, next to the current version of the seat map,
+so states read before a change can never be written over the states that follow it.
+Every change of a seat map moves its current version, and otherwise the cached entries
+expire after SEAT_MAP_CACHE_TIMEOUT seconds. The cache must be shared by all the worker
+processes (see CACHE_BACKEND), or the other processes would keep serving old versions.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from movies.models import SeatMap
+
+def _version_key(show_id, program_id):
+    return f"seatmap:{show_id}:{program_id}:version"
+
+def _states_key(show_id, program_id, version):
+    return f"seatmap:{show_id}:{program_id}:{version}"
+
+def seat_states(show_id, program_id):
+    """
+    Returns the version, rows, cols and seat states of a show's program,
+    from the cache or from its seat map, or None if it has no seat map.
+    """
+    version = cache.get(_version_key(show_id, program_id))
+    states = None
+    if version is not None:
+        states = cache.get(_states_key(show_id, program_id, version))
+    if states is None:
+        seat_map = SeatMap.objects.filter(show_id=show_id, program_id=program_id).first()
+        if seat_map is None:
+            return None
+        states = {
+            'version': seat_map.version,
+            'rows': seat_map.rows,
+            'cols': seat_map.cols,
+            'seats': seat_map.bitmap.as_rows(),
+        }
+        timeout = settings.SEAT_MAP_CACHE_TIMEOUT
+        cache.set(_states_key(show_id, program_id, seat_map.version), states, timeout)
+        # add does not replace a newer version that a change recorded meanwhile.
+        cache.add(_version_key(show_id, program_id), seat_map.version, timeout)
+    return states
+
+def invalidate(show_id, program_id, version):
+    """Records the version a seat map moved to, so that the states of older versions are not used."""
+    key = _version_key(show_id, program_id)
+    # Changes committed at the same time may be recorded out of order.
+    current = cache.get(key)
+    if current is None or current < version:
+        cache.set(key, version, settings.SEAT_MAP_CACHE_TIMEOUT)
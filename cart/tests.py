@@ -0,0 +1,380 @@
+"""
+The following tests cover seat holds, their expiry, the settlement of orders,
+the indexes of the booking lookups and the suggestions of the booking pickers.
+"""
+
+import datetime
+import threading
+from unittest import mock, skipUnless
+from django.db import connection
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from movies import typeahead
+from movies.models import Program, Seat, ShowSeat, SeatMap, Theater
+from movies.seatmap import AVAILABLE, RESERVED, UNAVAILABLE
+from movies.seating_patterns import LAYOUTS
+from movies.tests import create_movie, create_screen, create_show, create_theater, program
+from . import reservations, seatcache
+from .booking import BookingContext, HoldExpired, SettlementInProgress, book_tickets, settle
+from .broadcast import LocalBroadcaster, broadcaster, channel
+from .forms import ChooseMovieForm, ChooseTheaterForm, PaymentForm
+from .models import Order, Payment, Ticket
+from .reservations import hold_seats, release_expired_holds
+
+class HoldSeatsTests(TransactionTestCase):
+    """Holds made at the same time, and holds that stop half way."""
+
+    def setUp(self):
+        self.program = program(datetime.date.today() + datetime.timedelta(1), 20)
+        self.show = create_show(create_movie(), create_screen(create_theater()), self.program)
+        self.positions = LAYOUTS[self.show.screen.seating_pattern].positions
+
+    def held(self):
+        """Returns the number of held seats in the seat map and in ShowSeat."""
+        seat_map = SeatMap.objects.get(show=self.show, program=self.program)
+        return (seat_map.count(UNAVAILABLE),
+                ShowSeat.objects.filter(show=self.show, program=self.program,
+                                        status=UNAVAILABLE).count())
+
+    def test_concurrent_holds_never_share_a_seat(self):
+        """Buyers that want overlapping seats at the same time never get the same seat."""
+        wanted = [self.positions[start:start + 4] for start in range(0, 16, 2)]
+        claimed = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(wanted))
+
+        def buyer(positions):
+            try:
+                barrier.wait()
+                if not hold_seats(self.show.id, self.program.id, positions):
+                    with lock:
+                        claimed.extend(positions)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(positions,)) for positions in wanted]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(claimed)
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(self.held(), (len(claimed), len(claimed)))
+
+    def test_rejected_hold_changes_nothing(self):
+        """A hold that conflicts with another leaves the seats of both as they were."""
+        self.assertEqual(hold_seats(self.show, self.program.id, self.positions[:2]), [])
+        self.assertEqual(hold_seats(self.show, self.program.id, self.positions[1:3]),
+                         [self.positions[1]])
+        self.assertEqual(self.held(), (2, 2))
+        self.assertFalse(ShowSeat.objects.filter(
+            show=self.show, position=self.positions[2], hold_expires__isnull=False).exists())
+
+    def test_hold_interrupted_after_seat_map_is_released(self):
+        """Seats left held in the seat map by a hold that failed are freed when it expires."""
+        update_seats = reservations._update_seats
+
+        def fail_after_update(*args, **kwargs):
+            update_seats(*args, **kwargs)
+            raise RuntimeError('worker died')
+
+        with mock.patch.object(reservations, '_update_seats', fail_after_update):
+            with self.assertRaises(RuntimeError):
+                hold_seats(self.show, self.program.id, self.positions[:3])
+        self.assertEqual(self.held(), (3, 0))
+
+        later = timezone.now() + datetime.timedelta(days=1)
+        self.assertEqual(release_expired_holds(now=later), 3)
+        seat_map = SeatMap.objects.get(show=self.show, program=self.program)
+        self.assertEqual(seat_map.count(UNAVAILABLE), 0)
+        self.assertEqual(hold_seats(self.show, self.program.id, self.positions[:3]), [])
+
+    def test_expired_holds_are_released(self):
+        """release_expired_holds frees the seats of the holds that expired, and only those."""
+        hold_seats(self.show, self.program.id, self.positions[:2])
+        self.assertEqual(release_expired_holds(), 0)
+        later = timezone.now() + datetime.timedelta(days=1)
+        self.assertEqual(release_expired_holds(now=later), 2)
+        self.assertEqual(self.held(), (0, 0))
+        self.assertEqual(ShowSeat.objects.filter(
+            show=self.show, status=AVAILABLE).count(), len(self.positions))
+
+def payment_form():
+    """Returns a valid, bound payment form."""
+    form = PaymentForm(data={'cc_number': '4444333322221111', 'cc_expiry': '12/30', 'cc_code': '123'})
+    assert form.is_valid(), form.errors
+    return form
+
+class SettleTests(TestCase):
+    """Paying for the tickets of a draft, without relying on transactions."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.program = program(datetime.date.today() + datetime.timedelta(1), 20)
+        self.show = create_show(create_movie(), create_screen(create_theater()), self.program)
+        self.positions = LAYOUTS[self.show.screen.seating_pattern].positions[:2]
+        hold_seats(self.show, self.program.id, self.positions)
+        self.draft = book_tickets(self.user, self.show, self.program.id, self.positions)
+
+    def test_settle(self):
+        order, created = settle(self.user, self.draft, payment_form())
+        self.assertTrue(created)
+        self.assertEqual(order.idempotency_key, self.draft.key)
+        self.assertEqual(Ticket.objects.filter(order=order, paid=True).count(), 2)
+        seat_map = SeatMap.objects.get(show=self.show, program=self.program)
+        self.assertEqual(seat_map.count(RESERVED), 2)
+
+    def test_same_key_is_paid_once(self):
+        first, _ = settle(self.user, self.draft, payment_form())
+        second, created = settle(self.user, self.draft, payment_form())
+        self.assertFalse(created)
+        self.assertEqual(first, second)
+        self.assertEqual((Order.objects.count(), Payment.objects.count()), (1, 1))
+
+    def test_expired_hold_leaves_nothing(self):
+        """A draft whose tickets were released saves no payment and no order."""
+        release_expired_holds(now=timezone.now() + datetime.timedelta(days=1))
+        with self.assertRaises(HoldExpired):
+            settle(self.user, self.draft, payment_form())
+        self.assertEqual((Order.objects.count(), Payment.objects.count()), (0, 0))
+
+    def test_partly_expired_hold_unclaims_the_rest(self):
+        Ticket.objects.filter(seat_id=self.draft.seat_ids[0]).delete()
+        with self.assertRaises(HoldExpired):
+            settle(self.user, self.draft, payment_form())
+        self.assertEqual((Order.objects.count(), Payment.objects.count()), (0, 0))
+        self.assertFalse(Ticket.objects.filter(paid=True).exists())
+
+    def test_failure_after_the_claim_is_undone(self):
+        """A failure once the payment is saved deletes it and gives the tickets back."""
+        with mock.patch.object(Order.objects, 'create', side_effect=RuntimeError('lost')):
+            with self.assertRaises(RuntimeError):
+                settle(self.user, self.draft, payment_form())
+        self.assertEqual((Order.objects.count(), Payment.objects.count()), (0, 0))
+        self.assertEqual(Ticket.objects.filter(paid=False, order=None).count(), 2)
+        order, created = settle(self.user, self.draft, payment_form())
+        self.assertTrue(created)
+
+    def test_second_submit_while_the_first_is_paying(self):
+        """A payment that finds the tickets claimed by another one leaves its claim alone."""
+        first = min(self.draft.seat_ids, key=lambda seat_id: Ticket.objects.get(seat_id=seat_id).id)
+        # The other payment has claimed the first ticket and not created its order yet.
+        Ticket.objects.filter(seat_id=first).update(paid=True)
+        with self.assertRaises(SettlementInProgress):
+            settle(self.user, self.draft, payment_form())
+        self.assertEqual((Order.objects.count(), Payment.objects.count()), (0, 0))
+        self.assertEqual(list(Ticket.objects.filter(paid=True).values_list('seat_id', flat=True)),
+                         [first])
+
+    def test_second_submit_keeps_the_draft(self):
+        """The page of a double submit asks to wait, and the booking can still be paid."""
+        self.client.force_login(self.user)
+        session = self.client.session
+        BookingContext(show_id=self.show.id, program_id=self.program.id,
+                       draft=self.draft.as_dict()).save(session)
+        session.save()
+        Ticket.objects.update(paid=True)
+        response = self.client.post(reverse('cart:payment'), dict(
+            payment_form().data, idempotency_key=self.draft.key))
+        self.assertRedirects(response, reverse('cart:my-tickets'), fetch_redirect_response=False)
+        self.assertEqual(BookingContext.load(self.client.session).draft.key, self.draft.key)
+
+    def test_sweep_before_the_seats_are_confirmed(self):
+        """Seats whose order is created are not released, even before the payment confirms them."""
+        with mock.patch('cart.booking.confirm_seats'):
+            order, _ = settle(self.user, self.draft, payment_form())
+        self.assertEqual(release_expired_holds(now=timezone.now() + datetime.timedelta(days=1)), 0)
+        reservations.confirm_seats(self.show, self.program.id, self.positions)
+        self.assertEqual(Ticket.objects.filter(order=order).count(), 2)
+        seat_map = SeatMap.objects.get(show=self.show, program=self.program)
+        self.assertEqual(seat_map.count(RESERVED), 2)
+
+    def test_claim_without_order_is_released(self):
+        """Tickets claimed by a payment that stopped before the order are swept with the hold."""
+        Ticket.objects.update(paid=True)
+        release_expired_holds(now=timezone.now() + datetime.timedelta(days=1))
+        self.assertFalse(Ticket.objects.exists())
+        seat_map = SeatMap.objects.get(show=self.show, program=self.program)
+        self.assertEqual(seat_map.count(UNAVAILABLE), 0)
+
+@skipUnless(connection.vendor == 'sqlite', 'The query plans are checked with SQLite.')
+class IndexTests(TestCase):
+    """The lookups of the booking pages are answered from an index, never by a table scan."""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"USING (COVERING )?INDEX {index}\b", plan)
+        self.assertNotIn('SCAN', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_show_seat_position(self):
+        self.assertUsesIndex(
+            ShowSeat.objects.filter(show_id=1, program_id=1, position__in=['1, 1', '1, 2']),
+            'movies_showseat_show_id_program_id_position_.*_uniq')
+
+    def test_expired_holds(self):
+        self.assertUsesIndex(ShowSeat.objects.filter(hold_expires__lte=timezone.now()),
+                             'movies_showseat_hold_expires_.*')
+
+    def test_seat_position(self):
+        self.assertUsesIndex(Seat.objects.filter(screen_id=1, position__in=['1, 1']),
+                             'seat_screen_position_idx')
+
+    def test_user_tickets(self):
+        self.assertUsesIndex(
+            Ticket.objects.filter(user_id=1, show_id=1, program_id=1, paid=False),
+            'ticket_user_show_idx')
+
+    def test_latest_orders(self):
+        """The orders of a user come sorted from the index, for every page."""
+        self.assertUsesIndex(Order.objects.filter(user_id=1).order_by('-id')[:10],
+                             'order_user_id_idx')
+        self.assertUsesIndex(Order.objects.filter(user_id=1, id__lt=50).order_by('-id')[:10],
+                             'order_user_id_idx')
+
+    def test_program_day_hour(self):
+        self.assertUsesIndex(
+            Program.objects.filter(day=datetime.date(2030, 1, 1), hour=datetime.time(20)),
+            'program_day_hour_idx')
+        self.assertUsesIndex(Program.objects.filter(day__gte=datetime.date(2030, 1, 1)),
+                             'program_day_hour_idx')
+
+class SuggestionTests(TestCase):
+    """The movie and theater pickers suggest, and accept, only what can be booked."""
+
+    def setUp(self):
+        cache.clear()
+        tomorrow = program(datetime.date.today() + datetime.timedelta(1), 20)
+        later = program(datetime.date.today() + datetime.timedelta(30), 20)
+        self.village = create_theater('Village')
+        self.odeon = create_theater('Odeon')
+        self.playing = create_movie('Star Wars')
+        self.coming = create_movie('Star Trek')
+        create_show(self.playing, create_screen(self.village), tomorrow)
+        create_show(self.coming, create_screen(self.odeon), later)
+        typeahead.movies.load()
+        typeahead.theaters.load()
+
+    def suggest(self, name, query):
+        response = self.client.get(reverse(f"cart:{name}-suggestions"), {'q': query})
+        return [(result['id'], result['label']) for result in response.json()['results']]
+
+    def test_movies_played_this_week(self):
+        self.assertEqual(self.suggest('movie', 'sta'), [(self.playing.id, 'Star Wars')])
+        self.assertEqual(self.suggest('movie', 'trek'), [])
+
+    def test_theaters_of_the_chosen_movie(self):
+        self.assertEqual(self.suggest('theater', 'test'), [])
+        session = self.client.session
+        BookingContext(movie_id=self.playing.id).save(session)
+        session.save()
+        self.assertEqual(self.suggest('theater', 'vil'), [(self.village.id, 'Village, Test')])
+        self.assertEqual(self.suggest('theater', 'odeon'), [])
+
+    def test_chosen_ids_are_checked(self):
+        """An id posted from a suggestion is accepted only if it is in the form's choices."""
+        movie_id = self.suggest('movie', 'star')[0][0]
+        self.assertTrue(ChooseMovieForm({'movie': movie_id}).is_valid())
+        self.assertFalse(ChooseMovieForm({'movie': self.coming.id}).is_valid())
+        self.assertFalse(ChooseMovieForm({'movie': 'x'}).is_valid())
+
+        theaters = Theater.objects.filter(id=self.village.id)
+        self.assertTrue(ChooseTheaterForm({'theater': self.village.id}, qs=theaters).is_valid())
+        self.assertFalse(ChooseTheaterForm({'theater': self.odeon.id}, qs=theaters).is_valid())
+
+class SeatEventsTests(TestCase):
+    """The seat event streams are off by default, and limited in number when on."""
+
+    def setUp(self):
+        self.program = program(datetime.date.today() + datetime.timedelta(1), 20)
+        self.show = create_show(create_movie(), create_screen(create_theater()), self.program)
+        self.url = reverse('cart:seat-events', args=[self.show.id, self.program.id])
+
+    def test_disabled(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(SEAT_EVENTS=True, SEAT_EVENTS_MAX_STREAMS=1)
+    def test_streams_are_limited(self):
+        """Past the limit the page gets a 204, which stops its reconnects, until a stream closes."""
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(next(iter(response.streaming_content)).startswith(b'event: snapshot'))
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+        response.close()
+        self.assertEqual(broadcaster().subscribers(), 0)
+        second = self.client.get(self.url)
+        self.assertEqual(second['Content-Type'], 'text/event-stream')
+        second.close()
+
+    def test_limit_holds_for_concurrent_subscriptions(self):
+        """Subscriptions made at the same time never go past the limit."""
+        local = LocalBroadcaster()
+        barrier = threading.Barrier(20)
+        subscriptions = []
+
+        def subscribe(number):
+            barrier.wait()
+            subscriptions.append(local.subscribe(channel(number % 3, 1), limit=5))
+
+        threads = [threading.Thread(target=subscribe, args=(number,)) for number in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len([subscription for subscription in subscriptions if subscription]), 5)
+        self.assertEqual(local.subscribers(), 5)
+
+class SeatMapCacheTests(TransactionTestCase):
+    """The cached seat states and their ETag follow every change of the seat map."""
+
+    def setUp(self):
+        cache.clear()
+        self.program = program(datetime.date.today() + datetime.timedelta(1), 20)
+        self.show = create_show(create_movie(), create_screen(create_theater()), self.program)
+        self.positions = LAYOUTS[self.show.screen.seating_pattern].positions
+        self.url = reverse('cart:seat-map', args=[self.show.id, self.program.id])
+
+    def test_etag_changes_with_the_seat_map(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], '"0"')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"0"')
+        self.assertEqual(response.status_code, 304)
+
+        hold_seats(self.show, self.program.id, self.positions[:1])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(response.json()['seats'][0][0], UNAVAILABLE)
+
+    def test_late_reader_does_not_bring_back_old_states(self):
+        """States read before a change, and cached after it, are never served."""
+        stale = SeatMap.objects.get(show=self.show, program=self.program)
+        hold_seats(self.show, self.program.id, self.positions[:1])
+
+        class StaleSeatMaps:
+            """Answers like the query of a reader that started before the hold."""
+
+            def filter(self, **kwargs):
+                return self
+
+            def first(self):
+                return stale
+
+        with mock.patch.object(seatcache.SeatMap, 'objects', StaleSeatMaps()):
+            self.assertEqual(seatcache.seat_states(self.show.id, self.program.id)['version'], 0)
+        self.assertEqual(seatcache.seat_states(self.show.id, self.program.id)['version'], 1)
+
+    def test_versions_recorded_out_of_order(self):
+        hold_seats(self.show, self.program.id, self.positions[:1])
+        hold_seats(self.show, self.program.id, self.positions[1:2])
+        seatcache.invalidate(self.show.id, self.program.id, 1)
+        self.assertEqual(seatcache.seat_states(self.show.id, self.program.id)['version'], 2)
@@ -20,8 +20,13 @@ from . import views
 urlpatterns = [
     path('choose-movie/', views.choose_movie_view, name='choose-movie'),
     path('choose-theater/', views.choose_theater_view, name='choose-theater'),
+    path('suggestions/movies/', views.movie_suggestions_view, name='movie-suggestions'),
+    path('suggestions/theaters/', views.theater_suggestions_view, name='theater-suggestions'),
     path('choose-date/', views.choose_date_view, name='choose-date'),
     path('choose-seat/', views.choose_seat_view, name='choose-seat'),
+    path('seats/<int:show_id>/<int:program_id>/', views.seat_map_view, name='seat-map'),
+    path('seats/<int:show_id>/<int:program_id>/events/', views.seat_events_view,
+         name='seat-events'),
     path('payment/', views.payment, name='payment'),
     path('my-tickets/', views.my_tickets, name='my-tickets'),
 ]
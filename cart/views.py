@@ -3,15 +3,26 @@ The following views handle cart-related functions, including
 movie, theater, date and seat selection, payment, and tickets view.
 """
 
+import json
 from datetime import datetime, timedelta
-from decimal import Decimal
+from django.conf import settings
 from django.contrib import messages
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
-from django.core import serializers
-from movies.models import Show, Theater, Program, Seat, ShowSeat
-from movies.seating_patterns import SEATING_ARRAYS
+from django.utils.cache import get_conditional_response
+from movies import catalog, typeahead
+from movies.models import Show, Theater, Program, SeatMap
+from movies.seatmap import AVAILABLE
+from movies.seating_patterns import LAYOUTS
 from .forms import ChooseMovieForm, ChooseTheaterForm, ChooseDateForm, PaymentForm
 from .models import Ticket, Order
+from .reservations import hold_seats
+from .booking import BookingContext, HoldExpired, SettlementInProgress, book_tickets, settle
+from .broadcast import SeatEvents, broadcaster, channel
+from .seatcache import seat_states
+
+# Longest query the suggestion endpoints look up.
+MAX_QUERY = 100
 
 def choose_movie_view(request):
     """Checks whether the user's choice of a movie is valid and saves it."""
@@ -19,32 +30,56 @@ def choose_movie_view(request):
         form = ChooseMovieForm(request.POST)
         if form.is_valid():
             movie = form.cleaned_data.get('movie')
-            request.session['movie'] = movie.id
+            booking = BookingContext.load(request.session)
+            booking.choose_movie(movie.id)
+            booking.save(request.session)
             return redirect('cart:choose-theater')
     else:
         form = ChooseMovieForm()
     context = {'form': form}
     return render(request, 'cart/choose_movie.html', context)
 
+def _current_theaters(movie_id):
+    """Returns the theaters where a movie is played from today up until next week."""
+    today = datetime.now().date()
+    next_week = today + timedelta(7)
+    current_show = Show.objects.filter(
+        movie__id=movie_id, program__day__gte=today, program__day__lte=next_week).values('theater')
+    return Theater.objects.filter(id__in=current_show)
+
+def movie_suggestions_view(request):
+    """Returns, as JSON, the movies played up until next week whose name starts with the typed words."""
+    query = request.GET.get('q', '')[:MAX_QUERY]
+    suggestions = typeahead.movies.suggest(query, allowed=catalog.now_showing_ids())
+    return JsonResponse({'results': [{'id': id, 'label': label} for id, label in suggestions]})
+
+def theater_suggestions_view(request):
+    """
+    Returns, as JSON, the theaters where the chosen movie is played up until next week,
+    whose name, city or county starts with the typed words.
+    """
+    query = request.GET.get('q', '')[:MAX_QUERY]
+    movie_id = BookingContext.load(request.session).movie_id
+    allowed = _current_theaters(movie_id).values_list('id', flat=True) if movie_id else ()
+    suggestions = typeahead.theaters.suggest(query, allowed=allowed)
+    return JsonResponse({'results': [{'id': id, 'label': label} for id, label in suggestions]})
+
 def choose_theater_view(request):
     """
     Finds the theaters where a movie is currently played (up until next week),
     checks if the user's choice of a theater is valid and saves it.
     """
 
-    movie_id = request.session.get('movie')
-    now = datetime.now()
-    today = now.date()
-    next_week = today + timedelta(7)
-    current_show = Show.objects.filter(
-        movie__id=movie_id, program__day__gte=today, program__day__lte=next_week).values('theater')
-    theaters_qs = Theater.objects.filter(id__in=current_show)
+    booking = BookingContext.load(request.session)
+    movie_id = booking.movie_id
+    theaters_qs = _current_theaters(movie_id)
 
     if request.method == 'POST':
         form = ChooseTheaterForm(request.POST, qs=theaters_qs)
         if form.is_valid():
             theater = form.cleaned_data.get('theater')
-            request.session['theater'] = theater.id
+            booking.choose_theater(theater.id)
+            booking.save(request.session)
             return redirect('cart:choose-date')
     else:
         form = ChooseTheaterForm(qs=theaters_qs)
@@ -59,8 +94,9 @@ def choose_date_view(request):
     """
 
     show_id = []
-    movie_id = request.session.get('movie')
-    theater_id = request.session.get('theater')
+    booking = BookingContext.load(request.session)
+    movie_id = booking.movie_id
+    theater_id = booking.theater_id
     now = datetime.now()
     today = now.date()
     next_week = today + timedelta(7)
@@ -80,7 +116,8 @@ def choose_date_view(request):
         form = ChooseDateForm(request.POST, qs=date_qs)
         if form.is_valid():
             date = form.cleaned_data.get('date')
-            request.session['date'] = date.id
+            booking.choose_program(date.id)
+            booking.save(request.session)
             return redirect('cart:choose-seat')
     else:
         form = ChooseDateForm(qs=date_qs)
@@ -89,88 +126,128 @@ def choose_date_view(request):
     return render(request, 'cart/choose_date.html', context)
 
 def choose_seat_view(request):
-    """Handles seat selection and calculates total price of the tickets."""
-    movie_id = request.session.get('movie')
-    theater_id = request.session.get('theater')
-    date_id = request.session.get('date')
-    total = 0
-    ticket_list = []
-
-    current_show = Show.objects.filter(
-        movie__id=movie_id, theater__id=theater_id, program__id=date_id).first()
-    screen = current_show.screen
-    seats = ShowSeat.objects.filter(show=current_show, program__id=date_id)
-    seating_pattern = SEATING_ARRAYS[screen.seating_pattern]
+    """
+    Handles seat selection, holds the chosen seats and books their tickets.
+    The show was resolved when the date was chosen, so it is not looked up again.
+    """
+    booking = BookingContext.load(request.session)
+    if booking.show_id is None:
+        return render(request, 'cart/choose_seat.html', {'date': None})
+    layout = LAYOUTS[booking.seating_pattern]
 
     if request.method == 'POST':
         seat = request.POST.getlist('seat')
-        for position in seat:
-            show_seat_obj = ShowSeat.objects.get(
-                show=current_show, position=position, program__id=date_id)
-            show_seat_obj.status = 3
-            show_seat_obj.save()
-            show = Show.objects.get(
-                movie__id=movie_id, theater__id=theater_id, screen=screen, program__id=date_id)
-            seat_obj = Seat.objects.get(screen=screen, position=position)
-
-            program = Program.objects.get(id=date_id)
-            ticket_obj = Ticket.objects.create(
-                user=request.user, seat=seat_obj, show=show, program=program)
-            ticket_list.append(ticket_obj)
-
-            price = current_show.price
-            total = total + float(price)
-        request.session['total'] = total
-
         if not seat:
             messages.add_message(request, messages.INFO,
                                  'You have to select a seat before continuing.')
             return redirect('cart:choose-seat')
+
+        conflicts = hold_seats(booking.show_id, booking.program_id, seat)
+        if conflicts:
+            messages.add_message(request, messages.INFO,
+                                 'The following seats are no longer available: '
+                                 + '; '.join(conflicts))
+            return redirect('cart:choose-seat')
+
+        # The show is read again for its current price.
+        current_show = Show.objects.only('id', 'screen_id', 'price').get(pk=booking.show_id)
+        booking.draft = book_tickets(request.user, current_show, booking.program_id, seat)
+        booking.save(request.session)
+
         return redirect('cart:payment')
 
-    seats = serializers.serialize('json', list(
-        seats), fields=('position', 'status'))
-    context = {'seats': seats,
-               'seating_pattern': seating_pattern, 'date': date_id}
+    seat_map = SeatMap.objects.for_show(booking.show_id, booking.program_id)
+    context = {'seats': json.dumps(seat_map.bitmap.as_rows()),
+               'version': seat_map.version,
+               'available': seat_map.count(AVAILABLE),
+               'grid': layout.grid_html, 'date': booking.program_id,
+               'show': booking.show_id, 'seat_events': settings.SEAT_EVENTS}
     return render(request, 'cart/choose_seat.html', context)
 
+def seat_map_view(request, show_id, program_id):
+    """
+    Returns the seat states of a show's program as JSON, with the version of its seat map
+    as ETag. Requests for a version that has not changed are answered with 304 from the cache.
+    """
+    states = seat_states(show_id, program_id)
+    if states is None:
+        raise Http404('No seat map for this show.')
+    etag = f'"{states["version"]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(states)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def seat_events_view(request, show_id, program_id):
+    """
+    Streams the seat changes of a show's program to a seat page as server-sent events,
+    starting with a snapshot of the seat states. Once SEAT_EVENTS_MAX_STREAMS streams are open,
+    the page is answered with 204, which tells the browser not to reconnect, and polls instead.
+    """
+    if not settings.SEAT_EVENTS:
+        raise Http404('Seat events are disabled.')
+    # Subscribing before reading the snapshot makes sure no change is missed in between.
+    subscription = broadcaster().subscribe(
+        channel(show_id, program_id), limit=settings.SEAT_EVENTS_MAX_STREAMS)
+    if subscription is None:
+        return HttpResponse(status=204)
+    states = seat_states(show_id, program_id)
+    if states is None:
+        broadcaster().unsubscribe(subscription)
+        raise Http404('No seat map for this show.')
+    response = StreamingHttpResponse(
+        SeatEvents(subscription, states, settings.SEAT_EVENTS_KEEPALIVE),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def payment(request):
-    """Handles payment and creates an Order entry."""
+    """Handles payment of the booked tickets and creates an Order entry."""
+    booking = BookingContext.load(request.session)
+    draft = booking.draft
     if request.method == 'POST':
+        key = request.POST.get('idempotency_key')
+        if key and Order.objects.filter(user=request.user, idempotency_key=key).exists():
+            # The form was submitted again after the order was created.
+            return redirect('cart:my-tickets')
+        if draft is None:
+            messages.add_message(request, messages.INFO,
+                                 'You have to select a seat before continuing.')
+            return redirect('cart:choose-seat')
+
         form = PaymentForm(request.POST)
         if form.is_valid():
-            payment = form.save()
-            total = request.session.get('total')
-            total = Decimal(total)
-
-            movie_id = request.session.get('movie')
-            theater_id = request.session.get('theater')
-            date_id = request.session.get('date')
-            order_obj = Order.objects.create(
-                user=request.user, payment=payment, total=total)
-            current_show = Show.objects.filter(
-                movie__id=movie_id, theater__id=theater_id, program__id=date_id).first()
-            ticket_qs = Ticket.objects.filter(
-                user=request.user, show=current_show, paid=False, program__id=date_id)
-            for obj in ticket_qs:
-                obj.paid = True
-                obj.order = order_obj
-                obj.save()
+            try:
+                settle(request.user, draft, form)
+            except SettlementInProgress:
+                # The draft is kept, in case the other payment fails and has to be sent again.
+                messages.add_message(request, messages.INFO,
+                                     'Your payment is being processed. '
+                                     'Your tickets will be listed here once it is complete.')
+                return redirect('cart:my-tickets')
+            except HoldExpired:
+                booking.draft = None
+                booking.save(request.session)
+                messages.add_message(request, messages.INFO,
+                                     'Your seats were released because the payment took too long. '
+                                     'Please select your seats again.')
+                return redirect('cart:choose-seat')
+            booking.draft = None
+            booking.save(request.session)
             return redirect('cart:my-tickets')
     else:
-        form = PaymentForm()
+        form = PaymentForm(initial={'idempotency_key': draft.key if draft else ''})
 
-    context = {'form': form}
+    context = {'form': form, 'total': draft.total if draft else None}
     return render(request, 'cart/payment.html', context)
 
 def my_tickets(request):
     """Finds booked tickets."""
-    movie_id = request.session.get('movie')
-    theater_id = request.session.get('theater')
-    date_id = request.session.get('date')
-    current_show = Show.objects.filter(
-        movie__id=movie_id, theater__id=theater_id, program__id=date_id).first()
+    booking = BookingContext.load(request.session)
     tickets = Ticket.objects.filter(
-        user=request.user, show=current_show, paid=True, program__id=date_id)
+        user=request.user, show_id=booking.show_id, paid=True, program_id=booking.program_id)
     context = {'tickets': tickets}
     return render(request, 'cart/my_tickets.html', context)
@@ -0,0 +1,30 @@
+"""
+TypeaheadWidget replaces the select of a booking page with a text box that asks an
+autocomplete endpoint for suggestions while the user types, and a hidden input that
+holds the id of the chosen suggestion, so that the page does not render every option.
+"""
+
+from django import forms
+from django.urls import reverse
+
+class TypeaheadWidget(forms.Widget):
+    """
+    Text box with suggestions from the endpoint named url, which returns {"results":
+    [{"id": ..., "label": ...}]} for ?q=. label returns the label of a chosen id,
+    so that a form shown again keeps the user's choice.
+    """
+    template_name = 'cart/widgets/typeahead.html'
+
+    def __init__(self, url, label, attrs=None):
+        self.url = url
+        self.label = label
+        super().__init__(attrs)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        try:
+            label = self.label(int(value)) if value else None
+        except (TypeError, ValueError):
+            label = None
+        context['widget'].update({'url': reverse(self.url), 'label': label or ''})
+        return context
@@ -2,3 +2,8 @@ from django.apps import AppConfig
 
 class MoviesConfig(AppConfig):
     name = 'movies'
+
+    def ready(self):
+        # Connects the signals that invalidate the cached catalog, keep the related
+        # movies and search indexes and the typeahead tries up to date and resize the posters.
+        from . import catalog, images, related, search, typeahead  # noqa: F401
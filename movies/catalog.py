@@ -0,0 +1,144 @@
+"""
+The following functions find the movies that are played now, the ones coming soon,
+and the schedule of every theater. The results are computed once per day and cached,
+and the cache is dropped whenever a show, a program, a movie or a theater changes.
+The cache must be shared by all the worker processes (see CACHE_BACKEND), since the
+invalidations of one process, or of commands such as import_schedule, must reach the others.
+"""
+
+import time
+import threading
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+from .models import Movie, Program, Show, Theater
+
+# Seconds a cached result is kept, even if nothing changes.
+CACHE_TIMEOUT = 60*60
+
+VERSION_KEY = 'catalog:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+def stats():
+    """Returns the number of cache hits and misses of this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] = _stats[name] + 1
+
+def _version():
+    """Returns the version of the catalog, which changes every time the catalog is invalidated."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Starting from the current time keeps results cached before
+        # the version was evicted from being read again.
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+def _seconds_until_midnight():
+    """Returns the number of seconds until the next midnight in TIME_ZONE."""
+    now = timezone.localtime()
+    midnight = timezone.make_aware(
+        datetime.combine(now.date() + timedelta(1), datetime.min.time()))
+    return max(int((midnight - now).total_seconds()), 1)
+
+def cached(name, day, compute):
+    """
+    Returns the result of compute for the given day from the cache, computing it on a miss.
+    Results expire at midnight at the latest, when the current day changes.
+    """
+    key = f"catalog:{_version()}:{name}:{day.isoformat()}"
+    value = cache.get(key)
+    if value is None:
+        _count('misses')
+        value = compute()
+        cache.set(key, value, min(CACHE_TIMEOUT, _seconds_until_midnight()))
+    else:
+        _count('hits')
+    return value
+
+def _movie_ids(first_day, last_day=None):
+    """Returns the ids of the movies that have a show between the two days."""
+    shows = Show.objects.filter(program__day__gte=first_day)
+    if last_day is not None:
+        shows = shows.filter(program__day__lte=last_day)
+    return sorted(set(shows.values_list('movie_id', flat=True)))
+
+def showing(day=None):
+    """Returns the movies that have a show from the given day on, today by default."""
+    day = day or timezone.localdate()
+    ids = cached('showing', day, lambda: _movie_ids(day))
+    return Movie.objects.filter(id__in=ids)
+
+def now_showing_ids(day=None):
+    """Returns the ids of the movies that have a show in the week starting at the given day, today by default."""
+    day = day or timezone.localdate()
+    return cached('now-showing', day, lambda: _movie_ids(day, day + timedelta(7)))
+
+def now_showing(day=None):
+    """Returns the movies that have a show in the week starting at the given day, today by default."""
+    return Movie.objects.filter(id__in=now_showing_ids(day))
+
+def coming_soon(day=None):
+    """Returns the movies that have a show after the week starting at the given day, today by default."""
+    day = day or timezone.localdate()
+    ids = cached('coming-soon', day, lambda: _movie_ids(day + timedelta(8)))
+    return Movie.objects.filter(id__in=ids)
+
+def _group_schedule(rows):
+    """
+    Groups (theater id, city, theater, movie id, movie, day, hour) rows, sorted by city, theater,
+    movie, day and hour, into a list of theaters, each with its movies, days and hours.
+    Movies are told apart by id, so that two movies with the same name are listed apart.
+    """
+    theaters = []
+    for theater_id, city, theater, movie_id, movie, day, hour in rows:
+        if not theaters or theaters[-1]['id'] != theater_id:
+            theaters.append({'id': theater_id, 'city': city, 'name': theater, 'movies': []})
+        movies = theaters[-1]['movies']
+        if not movies or movies[-1]['id'] != movie_id:
+            movies.append({'id': movie_id, 'name': movie, 'days': []})
+        days = movies[-1]['days']
+        if not days or days[-1]['day'] != day:
+            days.append({'day': day, 'hours': []})
+        days[-1]['hours'].append(hour)
+    return theaters
+
+def schedule(day=None):
+    """
+    Returns the schedule of every theater from the given day on, today by default,
+    grouped by theater, movie and day. It is loaded with one query.
+    """
+    day = day or timezone.localdate()
+    rows = Show.program.through.objects.filter(program__day__gte=day).order_by(
+        'show__theater__city', 'show__theater__name', 'show__theater_id',
+        'show__movie__name', 'show__movie_id', 'program__day', 'program__hour'
+    ).values_list(
+        'show__theater_id', 'show__theater__city', 'show__theater__name',
+        'show__movie_id', 'show__movie__name', 'program__day', 'program__hour')
+    return cached('schedule', day, lambda: _group_schedule(rows))
+
+def invalidate(**kwargs):
+    """Drops every cached result, by moving the catalog to a new version."""
+    if kwargs.get('action', 'post').startswith('pre'):
+        return
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
+
+post_save.connect(invalidate, sender=Show)
+post_save.connect(invalidate, sender=Program)
+post_save.connect(invalidate, sender=Movie)
+post_save.connect(invalidate, sender=Theater)
+post_delete.connect(invalidate, sender=Show)
+post_delete.connect(invalidate, sender=Program)
+post_delete.connect(invalidate, sender=Movie)
+post_delete.connect(invalidate, sender=Theater)
+m2m_changed.connect(invalidate, sender=Show.program.through)
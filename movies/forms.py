@@ -1,10 +1,9 @@
 """The following form is used for adding a new movie show."""
-import time
-import datetime
-from datetime import date, timedelta
+from datetime import timedelta
 from django.core.exceptions import ValidationError
 from django import forms
-from .models import Show, Program
+from .models import MAX_PRICE, Show
+from .scheduling import ScreenSchedule, show_interval
 
 class ShowForm(forms.ModelForm):
     """Form used for adding a new Show entry."""
@@ -24,43 +23,25 @@ class ShowForm(forms.ModelForm):
         program = self.cleaned_data['program']
         price = self.cleaned_data['price']
 
-        if price > 15:
-            raise ValidationError('Price cannot be more than 15 euros.')
+        if price > MAX_PRICE:
+            raise ValidationError(f'Price cannot be more than {MAX_PRICE} euros.')
         if screen.theater.id != theater.id:
             raise ValidationError('Screen must belong to the theater!')
 
-        for prog in program:
-            shows = Show.objects.filter(screen=screen, program__day=prog.day).exclude(
-                pk=self.instance.pk).distinct()
-
-            for show in shows:
-                ex_movie_duration = int(show.movie.duration)*60 + 1800
-                new_movie_duration = int(movie.duration)*60 + 1800
-                new_time_str = time.strftime(
-                    '%H:%M:%S', time.gmtime(new_movie_duration))
-                new_time_object = datetime.datetime.strptime(
-                    new_time_str, '%H:%M:%S').time()
-                programs = show.program.filter(day=prog.day)
-
-                for progr in programs:
-                    diff = datetime.datetime.combine(date.today(
-                    ), progr.hour) - datetime.datetime.combine(date.today(), new_time_object)
-                    add = (datetime.datetime.combine(
-                        date.today(), progr.hour) + timedelta(seconds=ex_movie_duration)).time()
-                    if str(progr.hour) < str(add) and str(progr.hour) > str(diff):
-                        raise ValidationError(
-                            'Movie overlaps with another movie.')
-        for prog in program:
-            obj = Program.objects.filter(
-                day=prog.day, hour=prog.hour
-            ).values('hour')
-            shows = Show.objects.filter(
-                screen=screen,
-                program__day=prog.day,
-                program__hour__in=obj
-            ).exclude(pk=self.instance.pk)
-            if shows.exists():
-                raise ValidationError(
-                    'Screen is reserved for same day and same hour')
+        if program:
+            days = [prog.day for prog in program]
+            schedule = ScreenSchedule.load(
+                screen, min(days), max(days) + timedelta(1), exclude_show=self.instance.pk)
+
+            for prog in program:
+                interval = show_interval(prog.day, prog.hour, int(movie.duration))
+                overlapping = schedule.overlapping(interval)
+                if any(other.start == interval.start for other in overlapping):
+                    raise ValidationError(
+                        'Screen is reserved for same day and same hour')
+                if overlapping:
+                    raise ValidationError(
+                        'Movie overlaps with another movie.')
+                schedule.add(interval)
 
         return self.cleaned_data
@@ -0,0 +1,106 @@
+"""
+The following functions generate the resized variants of the movies' posters: a thumbnail,
+a card and a hero image, each as JPEG and as WebP. The variants are stored under names that
+contain a hash of the original image, so they never change and can be cached for ever,
+and the hash is kept in Movie.image_hash so that pages find them without touching the storage.
+They are generated when a movie is saved with a new image, or with the generate_posters command,
+so that no image is ever resized while a page is served.
+"""
+
+import io
+import hashlib
+import logging
+from PIL import Image, ImageOps, features
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_save
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+# Width in pixels of every variant.
+VARIANTS = {'thumb': 160, 'card': 360, 'hero': 1080}
+
+VARIANT_DIR = 'img/variants'
+HASH_LENGTH = 16
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+def _save_jpeg(image, output):
+    image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+def _save_webp(image, output):
+    image.save(output, 'WEBP', quality=WEBP_QUALITY, method=6)
+
+FORMATS = [('jpg', _save_jpeg)]
+if features.check('webp'):
+    FORMATS.append(('webp', _save_webp))
+
+def variant_name(image_hash, variant, extension):
+    """Returns the storage name of a variant of the image with the given hash."""
+    return f"{VARIANT_DIR}/{image_hash}-{variant}.{extension}"
+
+def variant_urls(image_hash, extension):
+    """Returns (url, width) pairs for every variant of an image in the given format, smallest first."""
+    return [
+        (default_storage.url(variant_name(image_hash, variant, extension)), width)
+        for variant, width in sorted(VARIANTS.items(), key=lambda item: item[1])
+    ]
+
+def _resize(image, width):
+    """Returns the image scaled down to the given width, keeping its aspect ratio."""
+    if image.width <= width:
+        return image
+    height = max(round(image.height * width / image.width), 1)
+    return image.resize((width, height), Image.LANCZOS)
+
+def generate_variants(movie, force=False):
+    """
+    Generates the variants of a movie's poster that do not exist yet, or all of them if force
+    is given, and stores the hash of the poster in the movie. Returns the number of files written.
+    """
+    if not movie.image:
+        return 0
+    movie.image.open('rb')
+    try:
+        data = movie.image.read()
+    finally:
+        movie.image.close()
+    image_hash = hashlib.sha1(data).hexdigest()[:HASH_LENGTH]
+    if image_hash == movie.image_hash and not force:
+        return 0
+
+    original = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+
+    written = 0
+    for variant, width in VARIANTS.items():
+        resized = _resize(original, width)
+        for extension, save in FORMATS:
+            name = variant_name(image_hash, variant, extension)
+            if default_storage.exists(name):
+                if not force:
+                    continue
+                default_storage.delete(name)
+            output = io.BytesIO()
+            save(resized, output)
+            default_storage.save(name, ContentFile(output.getvalue()))
+            written = written + 1
+
+    Movie.objects.filter(pk=movie.pk).update(image_hash=image_hash)
+    movie.image_hash = image_hash
+    return written
+
+def create_variants(sender, instance, **kwargs):
+    """
+    Generates the variants of the poster of a saved movie, if its poster changed. A poster
+    that cannot be read does not stop the movie from being saved; generate_posters retries it.
+    """
+    try:
+        generate_variants(instance)
+    except OSError:
+        logger.exception("Cannot generate the poster variants of movie %s", instance.pk)
+
+post_save.connect(create_variants, sender=Movie)
@@ -0,0 +1,69 @@
+"""
+Compares the related movies index with the per-genre queries and
+duplicate removal that the single movie page used before, on a synthetic catalog.
+"""
+
+import time
+import random
+from django.core.management.base import BaseCommand
+from movies.related import RelatedMoviesIndex
+
+class Command(BaseCommand):
+    """Builds a synthetic catalog in memory and times related movie lookups."""
+    help = 'Benchmarks related movie suggestions on a synthetic catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=10000,
+                            help='Number of movies in the catalog.')
+        parser.add_argument('--genres', type=int, default=20,
+                            help='Number of genres in the catalog.')
+        parser.add_argument('--lookups', type=int, default=200,
+                            help='Number of movies to find suggestions for.')
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        genre_ids = range(options['genres'])
+        catalog = {
+            movie_id: (random.sample(genre_ids, random.randint(1, 3)),
+                       round(random.uniform(1, 10), 1), random.randint(1950, 2020))
+            for movie_id in range(options['movies'])
+        }
+        movies_by_genre = {genre_id: [] for genre_id in genre_ids}
+        for movie_id, (genres, _, _) in catalog.items():
+            for genre_id in genres:
+                movies_by_genre[genre_id].append(movie_id)
+
+        index = RelatedMoviesIndex()
+        start = time.perf_counter()
+        index.fill(
+            [(movie_id, rating, year) for movie_id, (_, rating, year) in catalog.items()],
+            [(movie_id, genre_id) for movie_id, (genres, _, _) in catalog.items()
+             for genre_id in genres])
+        self.stdout.write(f"index built in {time.perf_counter() - start:.3f}s")
+
+        lookups = random.sample(list(catalog), min(options['lookups'], len(catalog)))
+
+        start = time.perf_counter()
+        for movie_id in lookups:
+            related_movies_list = []
+            for genre_id in catalog[movie_id][0]:
+                for temp in movies_by_genre[genre_id]:
+                    if temp != movie_id and temp not in related_movies_list:
+                        related_movies_list.append(temp)
+            related_movies_list = related_movies_list[:6]
+        self.report('per-genre scan with duplicate removal', len(lookups),
+                    time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for movie_id in lookups:
+            index.related(movie_id)
+        self.report('index, first lookup', len(lookups), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for movie_id in lookups:
+            index.related(movie_id)
+        self.report('index, memoized lookup', len(lookups), time.perf_counter() - start)
+
+    def report(self, label, lookups, elapsed):
+        """Writes the average time of a lookup."""
+        self.stdout.write(f"{label}: {elapsed / lookups * 1000:.3f} ms per movie")
@@ -0,0 +1,112 @@
+"""
+Compares the movie search index with a scan that matches the query against the text
+of every movie, like an icontains filter, on a synthetic catalog of Greek and English titles.
+The index is also timed while it is being built again, as it is every RELOAD_AFTER seconds.
+"""
+
+import time
+import random
+import itertools
+import threading
+from django.core.management.base import BaseCommand
+from movies.search import MOVIE_FIELDS, MovieSearchIndex, normalize, words
+
+LATIN = ['night', 'city', 'love', 'war', 'star', 'dark', 'river', 'ghost', 'summer', 'king',
+         'island', 'storm', 'secret', 'garden', 'winter', 'fire', 'blood', 'dream', 'road', 'sea']
+GREEK = ['νύχτα', 'πόλη', 'αγάπη', 'πόλεμος', 'αστέρι', 'σκοτάδι', 'ποτάμι', 'φάντασμα',
+         'καλοκαίρι', 'βασιλιάς', 'νησί', 'καταιγίδα', 'μυστικό', 'κήπος', 'χειμώνας', 'φωτιά']
+NAMES = ['Γιώργος', 'Μαρία', 'Νίκος', 'Ελένη', 'Anna', 'John', 'Sofia', 'Pedro', 'Amélie', 'Hans']
+SURNAMES = ['Παπαδόπουλος', 'Αγγελόπουλος', 'Κακογιάννης', 'Smith', 'Müller', 'García',
+            'Rossi', 'Dubois', 'Novak', 'Kowalski']
+GENRES = ['Drama', 'Comedy', 'Κωμωδία', 'Θρίλερ', 'Horror', 'Sci-Fi', 'Documentary', 'Western']
+LANGUAGES = ['Greek', 'English', 'French', 'German', 'Spanish']
+
+def _person():
+    return f"{random.choice(NAMES)} {random.choice(SURNAMES)}{random.randint(1, 500)}"
+
+class Command(BaseCommand):
+    """Builds a synthetic catalog in memory and times searches."""
+    help = 'Benchmarks movie search on a synthetic catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=100000,
+                            help='Number of movies in the catalog.')
+        parser.add_argument('--queries', type=int, default=500,
+                            help='Number of searches to time.')
+        parser.add_argument('--scans', type=int, default=20,
+                            help='Number of searches to time with the scan, which is slow.')
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        vocabulary = LATIN + GREEK
+        movies = []
+        links = []
+        for movie_id in range(options['movies']):
+            name = ' '.join(random.sample(vocabulary, random.randint(1, 3))).title()
+            name = f"{name} {random.randint(1, 999)}"
+            description = ' '.join(random.choice(vocabulary) for _ in range(25))
+            cast = ', '.join(_person() for _ in range(3))
+            movies.append((movie_id, name, _person(), cast, random.choice(LANGUAGES),
+                           description, round(random.uniform(1, 9.9), 1), random.randint(1950, 2020)))
+            links.extend((movie_id, genre) for genre in random.sample(GENRES, random.randint(1, 2)))
+
+        index = MovieSearchIndex()
+        start = time.perf_counter()
+        index.fill(movies, links)
+        self.stdout.write(f"index of {len(movies)} movies built in {time.perf_counter() - start:.3f}s")
+
+        queries = []
+        for _ in range(options['queries']):
+            movie = random.choice(movies)
+            kind = random.randrange(4)
+            if kind == 0:
+                # A title as typed, without accents and in capitals.
+                queries.append(normalize(movie[1]).upper())
+            elif kind == 1:
+                # The start of a title.
+                queries.append(movie[1][:random.randint(3, 8)])
+            elif kind == 2:
+                # A director's surname.
+                queries.append(movie[2].split()[1])
+            else:
+                # Two words of different fields.
+                queries.append(f"{movie[1].split()[0]} {random.choice(movie[3].split(', ')).split()[0]}")
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - start)
+        self.report('index', timings)
+
+        # Searches made while the index is built again are answered from the current one.
+        rebuild = threading.Thread(target=index.fill, args=(movies, links))
+        rebuild.start()
+        timings = []
+        for query in itertools.cycle(queries):
+            if not rebuild.is_alive():
+                break
+            start = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - start)
+        rebuild.join()
+        if timings:
+            self.report('index during a rebuild', timings)
+
+        texts = [(movie[0], normalize(' '.join(str(field) for field in movie[1:1 + len(MOVIE_FIELDS)])))
+                 for movie in movies]
+        timings = []
+        for query in queries[:options['scans']]:
+            start = time.perf_counter()
+            query_words = words(query)
+            [movie_id for movie_id, text in texts if all(word in text for word in query_words)]
+            timings.append(time.perf_counter() - start)
+        self.report('scan', timings)
+
+    def report(self, label, timings):
+        """Writes the p50, p95 and slowest time of the searches."""
+        timings = sorted(timings)
+        p50 = timings[len(timings) // 2] * 1000
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000
+        self.stdout.write(f"{label}: p50 {p50:.3f} ms, p95 {p95:.3f} ms, "
+                          f"max {timings[-1] * 1000:.3f} ms per search")
@@ -0,0 +1,70 @@
+"""
+Measures how fast the ShowSeat entries of a show are created,
+comparing one insert per seat with the bulk inserts used by the signals.
+"""
+
+import time
+import datetime
+from django.core.management.base import BaseCommand
+from movies.choices import SEATING_PATTERNS
+from movies.models import (
+    Movie, Theater, Screen, Show, Program, Seat, ShowSeat, materialize_show_seats)
+
+class Command(BaseCommand):
+    """Creates a throwaway show, materializes its seats both ways and reports rows/sec."""
+    help = 'Benchmarks the creation of ShowSeat entries for a show.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--programs', type=int, default=30,
+                            help='Number of programs the show is played at.')
+        parser.add_argument('--pattern', default='SEAT_1',
+                            choices=[name for name, _ in SEATING_PATTERNS],
+                            help='Seating pattern of the screen.')
+
+    def handle(self, *args, **options):
+        theater = Theater.objects.create(
+            name='Benchmark', city='Benchmark', county='Νομός Αττικής',
+            address='Benchmark', zipcode='00000')
+        movie = Movie.objects.create(
+            name='Benchmark', description='Benchmark', year=2000,
+            rating=5, duration=120, director='Benchmark', cast='Benchmark')
+        today = datetime.date.today()
+        programs = [
+            Program.objects.create(day=today + datetime.timedelta(i), hour=datetime.time(20))
+            for i in range(options['programs'])
+        ]
+        try:
+            screen = Screen.objects.create(
+                name='Benchmark', no_rows=0, no_cols=0, no_seats=0,
+                seating_pattern=options['pattern'], theater=theater)
+            show = Show.objects.create(movie=movie, theater=theater, screen=screen, price=9)
+            program_ids = [program.id for program in programs]
+
+            start = time.perf_counter()
+            rows = 0
+            for program in programs:
+                for seat in Seat.objects.filter(screen=screen):
+                    show_seat_obj = ShowSeat.objects.create(
+                        seat=seat, show=show, program=program, status=1, position=seat.position)
+                    show_seat_obj.save()
+                    rows = rows + 1
+            self.report('per-seat inserts', rows, time.perf_counter() - start)
+
+            ShowSeat.objects.filter(show=show).delete()
+
+            start = time.perf_counter()
+            rows = materialize_show_seats(show, program_ids)
+            self.report('bulk inserts', rows, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            rows = materialize_show_seats(show, program_ids)
+            self.report('bulk inserts, re-added programs', rows, time.perf_counter() - start)
+        finally:
+            theater.delete()
+            movie.delete()
+            Program.objects.filter(id__in=[program.id for program in programs]).delete()
+
+    def report(self, label, rows, elapsed):
+        """Writes the number of rows created and the insert rate."""
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f"{label}: {rows} rows in {elapsed:.3f}s ({rate:.0f} rows/sec)")
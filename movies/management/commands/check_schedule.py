@@ -0,0 +1,32 @@
+"""Checks the schedule of every screen for shows that overlap."""
+
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from movies.scheduling import schedule_conflicts
+
+class Command(BaseCommand):
+    """Lists the overlapping shows of every screen for a range of days, a week by default."""
+    help = 'Validates the schedule of all screens between two days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first_day', default=None,
+                            help='First day to check (YYYY-MM-DD), today by default.')
+        parser.add_argument('--days', type=int, default=7,
+                            help='Number of days to check.')
+
+    def handle(self, *args, **options):
+        if options['first_day']:
+            first_day = datetime.datetime.strptime(options['first_day'], '%Y-%m-%d').date()
+        else:
+            first_day = datetime.date.today()
+        last_day = first_day + datetime.timedelta(options['days'] - 1)
+
+        conflicts = schedule_conflicts(first_day, last_day)
+        for screen_id, pairs in conflicts.items():
+            for first, second in pairs:
+                self.stdout.write(
+                    f"Screen {screen_id}: show {first.show_id} at {first.start:%Y-%m-%d %H:%M} "
+                    f"overlaps with show {second.show_id} at {second.start:%Y-%m-%d %H:%M}")
+        if conflicts:
+            raise CommandError(f"{len(conflicts)} screens have overlapping shows.")
+        self.stdout.write(f"No overlapping shows between {first_day} and {last_day}.")
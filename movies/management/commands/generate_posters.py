@@ -0,0 +1,39 @@
+"""
+Generates the resized variants of the movies' posters, e.g. for the movies that were
+added before the variants existed, and reports how much smaller they are than the originals.
+"""
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from movies.images import FORMATS, VARIANTS, generate_variants, variant_name
+from movies.models import Movie
+
+class Command(BaseCommand):
+    """Generates the missing poster variants of every movie."""
+    help = 'Generates the resized variants of the movies\' posters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Generate the variants again even if they exist.')
+
+    def handle(self, *args, **options):
+        movies = Movie.objects.exclude(image='').exclude(image__isnull=True)
+        generated = 0
+        missing = 0
+        for movie in movies.iterator():
+            try:
+                if generate_variants(movie, force=options['force']):
+                    generated = generated + 1
+            except OSError as error:
+                self.stderr.write(f"{movie.name}: cannot read {movie.image.name}: {error}")
+                missing = missing + 1
+                continue
+            original = default_storage.size(movie.image.name)
+            sizes = ', '.join(
+                f"{variant} {default_storage.size(variant_name(movie.image_hash, variant, 'jpg'))//1024} KB"
+                for variant in VARIANTS)
+            self.stdout.write(f"{movie.name}: original {original//1024} KB, {sizes}")
+        formats = ', '.join(extension for extension, _ in FORMATS)
+        self.stdout.write(f"Generated the variants of {generated} posters ({formats}).")
+        if missing:
+            raise CommandError(f"{missing} posters could not be read.")
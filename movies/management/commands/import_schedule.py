@@ -0,0 +1,293 @@
+"""
+Imports a schedule of showtimes from a CSV file with the header movie,screen,day,hour,price
+(and optionally theater), or from a JSON lines file with the same keys, one showtime per line.
+movie, screen and theater are ids, day is YYYY-MM-DD and hour is HH:MM.
+
+The file is read twice and never loaded whole. The first pass validates every line and checks
+the showtimes for overlaps with each other and with the shows already scheduled, so that nothing
+is imported unless the whole file is valid. The second pass imports the showtimes in chunks:
+the showtimes of a movie on a screen at a price become one Show per chunk, and its programs,
+seats and seat maps are written with bulk inserts instead of one save per row. The programs
+are looked up by (day, hour) in memory, and the missing ones are created once, up front.
+Every chunk is committed on its own, and the progress reports the lines imported so far.
+Not every database rolls back a failed chunk, so its shows are deleted before the import stops,
+and --skip-existing resumes the import by skipping the showtimes already scheduled.
+"""
+
+import csv
+import json
+import time
+import itertools
+from collections import defaultdict
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from movies import catalog
+from movies.models import (Movie, Program, Screen, Seat, SeatMap, Show, ShowSeat,
+                           MAX_PRICE, SEAT_BATCH_SIZE, bulk_insert)
+from movies.scheduling import batch_conflicts, show_interval
+from movies.seating_patterns import LAYOUTS
+
+FIELDS = ('movie', 'screen', 'day', 'hour', 'price')
+
+# Most errors listed before the import gives up.
+MAX_ERRORS = 20
+
+def _rows(path, file_format):
+    """Yields the line number and the dict of every showtime of a file."""
+    with open(path, newline='', encoding='utf-8') as data:
+        if file_format == 'csv':
+            reader = csv.DictReader(data)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(data, 1):
+                if text.strip():
+                    try:
+                        row = json.loads(text)
+                    except ValueError as error:
+                        raise CommandError(f"Line {line} is not valid JSON: {error}")
+                    if not isinstance(row, dict):
+                        raise CommandError(f"Line {line} is not a JSON object.")
+                    yield line, row
+
+def _chunks(iterable, size):
+    """Yields lists of up to size items of an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+class Command(BaseCommand):
+    """Validates a schedule file as a whole, then imports it in chunks with bulk inserts."""
+    help = 'Imports showtimes from a CSV or JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The schedule file.')
+        parser.add_argument('--format', choices=['csv', 'json'], default=None,
+                            help='Format of the file, from its extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of showtimes imported per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the file.')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Skip the showtimes already scheduled, to resume an import.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        self.fields = {name: Show._meta.get_field(name) for name in ('price',)}
+        self.fields.update({name: Program._meta.get_field(name) for name in ('day', 'hour')})
+        self.durations = dict(Movie.objects.values_list('id', 'duration'))
+        self.screens = {screen_id: (theater_id, pattern) for screen_id, theater_id, pattern
+                        in Screen.objects.values_list('id', 'theater_id', 'seating_pattern')}
+        self.skip_existing = options['skip_existing']
+        self.existing = {}
+
+        start = time.perf_counter()
+        total, skipped, program_keys, screen_ids = self.validate(path, file_format)
+        self.stdout.write(f"{total} showtimes validated in {time.perf_counter() - start:.1f}s.")
+        if skipped:
+            self.stdout.write(f"{skipped} showtimes are already scheduled and will be skipped.")
+        if options['dry_run'] or total == skipped:
+            return
+
+        programs = self.programs(program_keys)
+        self.seats = defaultdict(list)
+        for screen_id, seat_id, position in Seat.objects.filter(
+                screen_id__in=screen_ids).values_list('screen_id', 'id', 'position'):
+            self.seats[screen_id].append((seat_id, position))
+
+        start = time.perf_counter()
+        imported = 0
+        counts = defaultdict(int)
+        # Bulk inserts send no signals, and the shows saved one by one would drop the cached
+        # catalog once each, so it is dropped once here, after the import.
+        post_save.disconnect(catalog.invalidate, sender=Show)
+        try:
+            for chunk in _chunks(_rows(path, file_format), options['chunk_size']):
+                rows = [self.parse(row) for _, row in chunk]
+                try:
+                    self.import_chunk([row for row in rows if not self.scheduled(row)],
+                                      programs, counts)
+                except Exception:
+                    self.stderr.write(
+                        f"The import stopped at the showtimes up to line {chunk[-1][0]}, "
+                        f"which were not imported. Run it again with --skip-existing to resume.")
+                    raise
+                imported = imported + len(chunk)
+                elapsed = max(time.perf_counter() - start, 1e-6)
+                self.stdout.write(f"{imported}/{total} showtimes up to line {chunk[-1][0]}, "
+                                  f"{imported / elapsed:.0f} per second.")
+        finally:
+            post_save.connect(catalog.invalidate, sender=Show)
+            catalog.invalidate()
+        self.stdout.write(
+            f"Imported {imported - skipped} showtimes as {counts['shows']} shows with "
+            f"{counts['seats']} seats in {time.perf_counter() - start:.1f}s.")
+
+    def parse(self, row):
+        """Returns the (movie, screen, theater, day, hour, price) of a row, or raises ValidationError."""
+        missing = [name for name in FIELDS if not str(row.get(name) or '').strip()]
+        if missing:
+            raise ValidationError(f"missing {', '.join(missing)}")
+        try:
+            movie_id, screen_id = int(row['movie']), int(row['screen'])
+            theater_id = int(row['theater']) if str(row.get('theater') or '').strip() else None
+        except (TypeError, ValueError):
+            raise ValidationError('movie, screen and theater must be ids')
+        day = self.fields['day'].to_python(str(row['day']).strip())
+        hour = self.fields['hour'].to_python(str(row['hour']).strip())
+        price = self.fields['price'].clean(str(row['price']).strip(), None)
+
+        if movie_id not in self.durations:
+            raise ValidationError(f"no movie {movie_id}")
+        if screen_id not in self.screens:
+            raise ValidationError(f"no screen {screen_id}")
+        if theater_id is not None and theater_id != self.screens[screen_id][0]:
+            raise ValidationError(f"screen {screen_id} does not belong to theater {theater_id}")
+        if price > MAX_PRICE:
+            raise ValidationError(f"price cannot be more than {MAX_PRICE} euros")
+        return movie_id, screen_id, self.screens[screen_id][0], day, hour, price
+
+    def scheduled(self, row):
+        """
+        Tells whether the showtime of a parsed row was scheduled before the import,
+        when --skip-existing is given. The showtimes of a screen are loaded once.
+        """
+        if not self.skip_existing:
+            return False
+        movie_id, screen_id, _, day, hour, _ = row
+        if screen_id not in self.existing:
+            self.existing[screen_id] = set(Show.program.through.objects.filter(
+                show__screen_id=screen_id).values_list(
+                    'show__movie_id', 'program__day', 'program__hour'))
+        return (movie_id, day, hour) in self.existing[screen_id]
+
+    def validate(self, path, file_format):
+        """
+        Checks every line of the file and the overlaps of its showtimes, and returns the number
+        of showtimes, the number of them already scheduled, the (day, hour) of the programs of
+        the others and the ids of their screens.
+        Raises CommandError with the first MAX_ERRORS problems if the file is not valid.
+        """
+        errors = []
+        intervals = defaultdict(list)
+        program_keys = set()
+        total = 0
+        skipped = 0
+        for line, row in _rows(path, file_format):
+            total = total + 1
+            try:
+                parsed = self.parse(row)
+            except ValidationError as error:
+                errors.append(f"Line {line}: {'; '.join(error.messages)}")
+                if len(errors) >= MAX_ERRORS:
+                    break
+                continue
+            if self.scheduled(parsed):
+                skipped = skipped + 1
+                continue
+            movie_id, screen_id, _, day, hour, _ = parsed
+            intervals[screen_id].append(
+                show_interval(day, hour, self.durations[movie_id], line=line))
+            program_keys.add((day, hour))
+
+        if not errors:
+            for screen_id, pairs in batch_conflicts(intervals).items():
+                for first, second in pairs:
+                    errors.append(f"Screen {screen_id}: {self.describe(first)} "
+                                  f"overlaps with {self.describe(second)}")
+        if errors:
+            for error in errors[:MAX_ERRORS]:
+                self.stderr.write(error)
+            raise CommandError(f"Problems found: {len(errors)}, nothing was imported.")
+        return total, skipped, program_keys, set(intervals)
+
+    def describe(self, interval):
+        """Returns where a conflicting showtime comes from, for the error messages."""
+        where = f"line {interval.line}" if interval.line is not None else f"show {interval.show_id}"
+        return f"{where} at {interval.start:%Y-%m-%d %H:%M}"
+
+    def programs(self, program_keys):
+        """
+        Returns the {(day, hour): program id} of the programs of the file,
+        creating the missing ones with one bulk insert.
+        """
+        days = [day for day, _ in program_keys]
+
+        def load():
+            programs = {}
+            for program_id, day, hour in Program.objects.filter(
+                    day__gte=min(days), day__lte=max(days)).order_by('id').values_list(
+                        'id', 'day', 'hour'):
+                programs.setdefault((day, hour), program_id)
+            return programs
+
+        programs = load()
+        missing = [Program(day=day, hour=hour) for day, hour in program_keys
+                   if (day, hour) not in programs]
+        if missing:
+            bulk_insert(Program, missing)
+            programs = load()
+            self.stdout.write(f"Created {len(missing)} programs.")
+        return programs
+
+    def import_chunk(self, rows, programs, counts):
+        """
+        Creates the shows of a chunk of showtimes, their programs, seats and seat maps.
+        If the chunk fails, its shows are deleted with all that was written for them.
+        """
+        show_programs = defaultdict(list)
+        for movie_id, screen_id, theater_id, day, hour, price in rows:
+            show_programs[(movie_id, screen_id, theater_id, price)].append(programs[(day, hour)])
+
+        shows = [Show(movie_id=movie_id, screen_id=screen_id, theater_id=theater_id, price=price)
+                 for movie_id, screen_id, theater_id, price in show_programs]
+        try:
+            self.write_chunk(shows, show_programs, counts)
+        except Exception:
+            # djongo does not roll the transaction back, and deleting the shows
+            # cascades to their programs, seats and seat maps.
+            Show.objects.filter(id__in=[show.id for show in shows if show.id]).delete()
+            raise
+        counts['shows'] = counts['shows'] + len(shows)
+
+    def write_chunk(self, shows, show_programs, counts):
+        """Inserts the shows of a chunk and their programs, seats and seat maps in one transaction."""
+        seats = 0
+        with transaction.atomic():
+            if connection.features.can_return_ids_from_bulk_insert:
+                Show.objects.bulk_create(shows)
+            else:
+                # Without the ids of the inserted rows, the shows are saved one by one.
+                for show in shows:
+                    show.save()
+
+            links = []
+            seat_maps = []
+            for show, program_ids in zip(shows, show_programs.values()):
+                bitmap = LAYOUTS[self.screens[show.screen_id][1]].bitmap()
+                for program_id in program_ids:
+                    links.append(Show.program.through(show_id=show.id, program_id=program_id))
+                    seat_maps.append(SeatMap(show_id=show.id, program_id=program_id,
+                                             rows=bitmap.rows, cols=bitmap.cols,
+                                             states=bitmap.to_bytes()))
+            bulk_insert(Show.program.through, links)
+            bulk_insert(SeatMap, seat_maps)
+
+            # The seats are built a batch at a time, so that memory does not grow with the chunk.
+            show_seats = (
+                ShowSeat(seat_id=seat_id, show_id=show.id, program_id=program_id,
+                         status=1, position=position)
+                for show, program_ids in zip(shows, show_programs.values())
+                for program_id in program_ids
+                for seat_id, position in self.seats[show.screen_id]
+            )
+            for batch in _chunks(show_seats, SEAT_BATCH_SIZE):
+                bulk_insert(ShowSeat, batch)
+                seats = seats + len(batch)
+        counts['seats'] = counts['seats'] + seats
@@ -0,0 +1,33 @@
+# Generated by Django 2.1.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0024_auto_20221201_1858'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatMap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rows', models.PositiveIntegerField()),
+                ('cols', models.PositiveIntegerField()),
+                ('states', models.BinaryField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.Program')),
+                ('show', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.Show')),
+            ],
+            options={
+                'verbose_name_plural': 'SeatMaps',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='seatmap',
+            unique_together={('show', 'program')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0025_seatmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showseat',
+            name='hold_expires',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.1.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def remove_duplicate_show_seats(apps, schema_editor):
+    """
+    Keeps one ShowSeat per show, program and position before they are made unique.
+    Programs added to a show after it was created got a second copy of the seats of
+    its other programs, so the copy kept is a taken seat when there is one.
+    """
+    ShowSeat = apps.get_model('movies', 'ShowSeat')
+    kept = None
+    duplicates = []
+    # Available seats have the lowest status, so the first row of every group is kept.
+    rows = ShowSeat.objects.order_by('show_id', 'program_id', 'position', '-status').values_list(
+        'id', 'show_id', 'program_id', 'position')
+    for seat_id, show_id, program_id, position in rows.iterator():
+        if kept == (show_id, program_id, position):
+            duplicates.append(seat_id)
+        kept = (show_id, program_id, position)
+    for start in range(0, len(duplicates), 500):
+        ShowSeat.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0026_showseat_hold_expires'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_show_seats, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='showseat',
+            unique_together={('show', 'program', 'position')},
+        ),
+        migrations.AddIndex(
+            model_name='program',
+            index=models.Index(fields=['day', 'hour'], name='program_day_hour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['screen', 'position'], name='seat_screen_position_idx'),
+        ),
+    ]
@@ -1,9 +1,25 @@
 """The following models are related to movies."""
 import datetime
+from django.db import IntegrityError, connection, models, transaction
 from django.db.models.signals import post_save, m2m_changed
-from djongo import models
 from .choices import COUNTY_CHOICES, SEAT_CHOICES, SEATING_PATTERNS, year_choices
-from .seating_patterns import SEATING_ARRAYS
+from .seating_patterns import LAYOUTS
+from .seatmap import SeatBitmap, NO_SEAT, parse_position
+
+# Number of rows sent to the database per bulk insert.
+SEAT_BATCH_SIZE = 1000
+
+# The highest price of a show's ticket, in euros.
+MAX_PRICE = 15
+
+def bulk_insert(model, objs):
+    """
+    Inserts objs in chunks of SEAT_BATCH_SIZE rows, or less if the
+    database backend cannot take that many parameters in one query.
+    """
+    fields = model._meta.concrete_fields
+    batch_size = min(SEAT_BATCH_SIZE, connection.ops.bulk_batch_size(fields, objs))
+    model.objects.bulk_create(objs, batch_size=max(batch_size, 1))
 
 class Genre(models.Model):
     """Stores the genre of a movie."""
@@ -44,6 +60,8 @@ class Movie(models.Model):
     cast = models.CharField(max_length=255, blank=False)
     trailer = models.URLField(blank=True)  # embed url form youtube
     image = models.ImageField(null=True, blank=True, upload_to='img/')
+    # Hash of the image whose resized variants have been generated, see movies.images.
+    image_hash = models.CharField(max_length=16, blank=True, editable=False)
     theater = models.ManyToManyField(Theater, through='Show')
 
     class Meta:
@@ -70,23 +88,23 @@ class Screen(models.Model):
 
 def create_seats(sender, instance, created, **kwargs):
     """Creates the seats of a theater's screen according to the seating plan of the screen."""
-    num_seats = 0
     if created:
-        seating_pattern = SEATING_ARRAYS[instance.seating_pattern]
-        for row, seats in enumerate(seating_pattern):
-            for pos, seat in enumerate(seats):
-                if seat:
-                    num_seats = num_seats+1
-                    Seat.objects.create(
-                        screen=instance,
-                        position=f"{str(row+1)}, {str(pos+1)}",
-                        status=1
-                    )
-
-        instance.no_rows = row+1
-        instance.no_cols = pos+1
-        instance.no_seats = num_seats
-        instance.save()
+        layout = LAYOUTS[instance.seating_pattern]
+        seats = [
+            Seat(screen=instance, position=position, status=1)
+            for position in layout.positions
+        ]
+
+        instance.no_rows = layout.rows
+        instance.no_cols = layout.cols
+        instance.no_seats = layout.seat_count
+        with transaction.atomic():
+            bulk_insert(Seat, seats)
+            Screen.objects.filter(pk=instance.pk).update(
+                no_rows=instance.no_rows,
+                no_cols=instance.no_cols,
+                no_seats=instance.no_seats
+            )
 
 post_save.connect(create_seats, sender=Screen)
 
@@ -97,6 +115,7 @@ class Program(models.Model):
 
     class Meta:
         verbose_name_plural = "Programs"
+        indexes = [models.Index(fields=['day', 'hour'], name='program_day_hour_idx')]
 
     def __str__(self):
         return f"{str(self.day)}, {str(self.hour)}"
@@ -119,15 +138,51 @@ class Show(models.Model):
     def __str__(self):
         return f"{self.movie.name}, {self.screen.name}, {self.theater.name}"
 
-def create_show_seat(sender, instance, action, **kwargs):
-    """Creates an instance of ShowSeat."""
-    if action == "post_add":
-        seat_obj = Seat.objects.filter(screen=instance.screen)
-        for pk in instance.program.all():
-            for obj in seat_obj:
-                show_seat_obj = ShowSeat.objects.create(
-                    seat=obj, show=instance, program=pk, status=1, position=obj.position)
-                show_seat_obj.save()
+def materialize_show_seats(show, program_ids):
+    """
+    Creates the ShowSeat entries of a show for the given programs with bulk inserts.
+    Seats that already have an entry for a program are skipped, so calling it again
+    for the same programs does not create duplicates. Returns the number of rows created.
+    """
+    program_ids = list(program_ids)
+    seats = list(Seat.objects.filter(
+        screen_id=show.screen_id).values_list('id', 'position'))
+    existing = set(ShowSeat.objects.filter(
+        show=show, program_id__in=program_ids).values_list('program_id', 'seat_id'))
+
+    show_seats = [
+        ShowSeat(seat_id=seat_id, show=show, program_id=program_id,
+                 status=1, position=position)
+        for program_id in program_ids
+        for seat_id, position in seats
+        if (program_id, seat_id) not in existing
+    ]
+
+    # Programs that already had seats keep their states, their seat map
+    # is built from the ShowSeat entries by SeatMap.objects.for_show.
+    started = {program_id for program_id, _ in existing}
+    started.update(SeatMap.objects.filter(
+        show=show, program_id__in=program_ids).values_list('program_id', flat=True))
+    bitmap = LAYOUTS[show.screen.seating_pattern].bitmap()
+    seat_maps = [
+        SeatMap(show=show, program_id=program_id, rows=bitmap.rows,
+                cols=bitmap.cols, states=bitmap.to_bytes())
+        for program_id in program_ids if program_id not in started
+    ]
+
+    with transaction.atomic():
+        bulk_insert(ShowSeat, show_seats)
+        bulk_insert(SeatMap, seat_maps)
+    return len(show_seats)
+
+def create_show_seat(sender, instance, action, reverse, pk_set, **kwargs):
+    """Creates the ShowSeat entries of the programs that were added to a show."""
+    if action == "post_add" and pk_set:
+        if reverse:
+            for show in Show.objects.filter(pk__in=pk_set):
+                materialize_show_seats(show, [instance.pk])
+        else:
+            materialize_show_seats(instance, pk_set)
 
 m2m_changed.connect(create_show_seat, sender=Show.program.through)
 
@@ -144,6 +199,7 @@ class Seat(models.Model):
 
     class Meta:
         verbose_name_plural = "Seats"
+        indexes = [models.Index(fields=['screen', 'position'], name='seat_screen_position_idx')]
 
     def __str__(self):
         return f"{self.position}, {self.screen}"
@@ -155,9 +211,98 @@ class ShowSeat(models.Model):
     program = models.ForeignKey(Program, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=SEAT_CHOICES)
     position = models.CharField(max_length=6)
+    hold_expires = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         verbose_name_plural = "ShowSeat"
+        unique_together = (('show', 'program', 'position'),)
 
     def __str__(self):
         return f"{self.seat}, {self.show}, {self.program}"
+
+class SeatMapManager(models.Manager):
+    """Finds the seat map of a show's program."""
+
+    def for_show(self, show, program_id):
+        """
+        Returns the seat map of a show's program, where show is a Show or its id.
+        If it does not exist yet, e.g. for shows added before seat maps existed,
+        it is built from the ShowSeat entries.
+        """
+        seat_map = self.filter(show=show, program_id=program_id).first()
+        if seat_map is None:
+            if not isinstance(show, Show):
+                show = Show.objects.select_related('screen').get(pk=show)
+            bitmap = LAYOUTS[show.screen.seating_pattern].bitmap()
+            show_seats = ShowSeat.objects.filter(
+                show=show, program_id=program_id).values_list('position', 'status')
+            for position, status in show_seats:
+                bitmap.set(*parse_position(position), int(status))
+            try:
+                with transaction.atomic():
+                    seat_map = self.create(
+                        show=show, program_id=program_id, rows=bitmap.rows,
+                        cols=bitmap.cols, states=bitmap.to_bytes())
+            except IntegrityError:
+                seat_map = self.get(show=show, program_id=program_id)
+        return seat_map
+
+class SeatMap(models.Model):
+    """
+    Stores the state of all the seats of a show's program in one entry,
+    packed in a bitmap laid out like the seating pattern of the screen.
+    """
+
+    show = models.ForeignKey(Show, on_delete=models.CASCADE)
+    program = models.ForeignKey(Program, on_delete=models.CASCADE)
+    rows = models.PositiveIntegerField()
+    cols = models.PositiveIntegerField()
+    states = models.BinaryField()
+    version = models.PositiveIntegerField(default=0)
+
+    objects = SeatMapManager()
+
+    class Meta:
+        verbose_name_plural = "SeatMaps"
+        unique_together = (('show', 'program'),)
+
+    def __str__(self):
+        return f"{self.show}, {self.program}"
+
+    @property
+    def bitmap(self):
+        """Returns the seat states as a SeatBitmap."""
+        return SeatBitmap(self.rows, self.cols, self.states)
+
+    def count(self, state):
+        """Returns the number of seats that are in the given state."""
+        return self.bitmap.count(state)
+
+    def update_seats(self, changes, expected=None):
+        """
+        Applies a {(row, col): state} dict of changes to the seat map in one atomic update.
+        The update only succeeds if nobody else changed the seat map since it was read,
+        otherwise the seat map is read again and the changes are retried.
+        If expected is given, all the seats must be in that state for the changes to be applied.
+        Returns the positions that could not be changed, which is empty on success.
+        """
+        while True:
+            bitmap = self.bitmap
+            conflicts = [
+                (row, col) for row, col in changes
+                if bitmap.get(row, col) == NO_SEAT
+                or (expected is not None and bitmap.get(row, col) != expected)
+            ]
+            if conflicts:
+                return conflicts
+
+            for (row, col), state in changes.items():
+                bitmap.set(row, col, state)
+            states = bitmap.to_bytes()
+            updated = SeatMap.objects.filter(pk=self.pk, version=self.version).update(
+                states=states, version=self.version+1)
+            if updated:
+                self.states = states
+                self.version = self.version+1
+                return []
+            self.refresh_from_db(fields=['states', 'version'])
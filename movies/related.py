@@ -0,0 +1,149 @@
+"""
+RelatedMoviesIndex suggests movies that share genres with a movie. It keeps, in memory,
+the genres of every movie and the movies of every genre, and ranks the suggestions by
+the number of shared genres, then by rating and year. The index is loaded on first use,
+updated from the signals of Movie and Genre, and reloaded every RELOAD_AFTER seconds
+so that changes made by other processes are picked up.
+"""
+
+import time
+import heapq
+import threading
+from collections import Counter, defaultdict
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from .models import Genre, Movie
+
+# Seconds after which the index is loaded again from the database.
+RELOAD_AFTER = 10*60
+
+class RelatedMoviesIndex:
+    """Inverted index from genres to movies, with the suggestions of each movie memoized."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self.clear()
+
+    @property
+    def loaded(self):
+        """Whether the index has been loaded from the database."""
+        return self._loaded_at is not None
+
+    def clear(self):
+        """Empties the index."""
+        with self._lock:
+            self._genres = {}
+            self._movies = defaultdict(set)
+            self._scores = {}
+            self._related = {}
+
+    def load(self):
+        """Loads every movie and its genres with two queries."""
+        self.fill(Movie.objects.values_list('id', 'rating', 'year'),
+                  Movie.genre.through.objects.values_list('movie_id', 'genre_id'))
+
+    def fill(self, movies, links):
+        """Replaces the index with (id, rating, year) movies and (movie id, genre id) links."""
+        with self._lock:
+            self.clear()
+            for movie_id, rating, year in movies:
+                self._genres[movie_id] = frozenset()
+                self._scores[movie_id] = (float(rating or 0), year or 0)
+            for movie_id, genre_id in links:
+                self._genres[movie_id] = self._genres.get(movie_id, frozenset()) | {genre_id}
+                self._movies[genre_id].add(movie_id)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if not self.loaded or time.monotonic() - self._loaded_at > RELOAD_AFTER:
+            self.load()
+
+    def genres(self, movie_id):
+        """Returns the genre ids of a movie."""
+        return self._genres.get(movie_id, frozenset())
+
+    def add(self, movie_id, genre_ids, rating, year):
+        """Adds a movie to the index, or updates it."""
+        with self._lock:
+            self.set_genres(movie_id, genre_ids)
+            self._scores[movie_id] = (float(rating or 0), year or 0)
+            self._related = {}
+
+    def set_genres(self, movie_id, genre_ids):
+        """Replaces the genres of a movie."""
+        with self._lock:
+            for genre_id in self._genres.get(movie_id, ()):
+                self._movies[genre_id].discard(movie_id)
+            self._genres[movie_id] = frozenset(genre_ids)
+            for genre_id in self._genres[movie_id]:
+                self._movies[genre_id].add(movie_id)
+            self._related = {}
+
+    def remove(self, movie_id):
+        """Removes a movie from the index."""
+        with self._lock:
+            self.set_genres(movie_id, ())
+            self._genres.pop(movie_id, None)
+            self._scores.pop(movie_id, None)
+
+    def remove_genre(self, genre_id):
+        """Removes a genre from every movie of the index."""
+        with self._lock:
+            for movie_id in self._movies.pop(genre_id, ()):
+                self._genres[movie_id] = self._genres[movie_id] - {genre_id}
+            self._related = {}
+
+    def related(self, movie_id, limit=6):
+        """
+        Returns the ids of the movies that share the most genres with the given movie,
+        best first. Movies sharing as many genres are ranked by rating, then by year.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            key = (movie_id, limit)
+            if key not in self._related:
+                shared = Counter()
+                for genre_id in self._genres.get(movie_id, ()):
+                    shared.update(self._movies[genre_id])
+                shared.pop(movie_id, None)
+                self._related[key] = heapq.nlargest(
+                    limit, shared,
+                    key=lambda other: (shared[other],) + self._scores.get(other, (0, 0)))
+            return self._related[key]
+
+index = RelatedMoviesIndex()
+
+def update_movie(sender, instance, **kwargs):
+    """Updates the rating and year of a saved movie."""
+    if index.loaded:
+        index.add(instance.id, index.genres(instance.id), instance.rating, instance.year)
+
+def remove_movie(sender, instance, **kwargs):
+    """Removes a deleted movie."""
+    if index.loaded:
+        index.remove(instance.id)
+
+def remove_genre(sender, instance, **kwargs):
+    """Removes a deleted genre from every movie."""
+    if index.loaded:
+        index.remove_genre(instance.id)
+
+def update_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    """Updates the genres of the movies whose genres changed."""
+    if not index.loaded or not action.startswith('post'):
+        return
+    if reverse and action == 'post_clear':
+        index.remove_genre(instance.id)
+        return
+    movie_ids = pk_set if reverse else [instance.id]
+    genres = defaultdict(set)
+    for movie_id, genre_id in Movie.genre.through.objects.filter(
+            movie_id__in=movie_ids).values_list('movie_id', 'genre_id'):
+        genres[movie_id].add(genre_id)
+    for movie_id in movie_ids:
+        index.set_genres(movie_id, genres[movie_id])
+
+post_save.connect(update_movie, sender=Movie)
+post_delete.connect(remove_movie, sender=Movie)
+post_delete.connect(remove_genre, sender=Genre)
+m2m_changed.connect(update_genres, sender=Movie.genre.through)
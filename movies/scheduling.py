@@ -0,0 +1,125 @@
+"""
+The following classes and functions check whether the shows played on a screen overlap.
+A show occupies its screen from the hour of its program for the duration of the movie
+plus a break, so shows that start late may run past midnight into the next day.
+"""
+
+import bisect
+import datetime
+from operator import attrgetter
+from collections import defaultdict, namedtuple
+from .models import Show
+
+# Time a screen needs between two shows.
+BREAK = datetime.timedelta(minutes=30)
+
+# line is the line of an imported schedule file that the interval comes from, if any.
+Interval = namedtuple('Interval', ['start', 'end', 'show_id', 'program_id', 'line'])
+
+def show_interval(day, hour, duration, show_id=None, program_id=None, line=None):
+    """Returns the interval during which a movie of the given duration (in minutes) occupies the screen."""
+    start = datetime.datetime.combine(day, hour)
+    return Interval(start, start + datetime.timedelta(minutes=duration) + BREAK,
+                    show_id, program_id, line)
+
+def _load_intervals(first_day, last_day, screens=None, exclude_show=None):
+    """
+    Loads the intervals of the shows played between the two days with one query,
+    grouped by screen id. Shows of the day before are included, since they may
+    still be running after midnight.
+    """
+    links = Show.program.through.objects.filter(
+        program__day__gte=first_day - datetime.timedelta(1),
+        program__day__lte=last_day
+    )
+    if screens is not None:
+        links = links.filter(show__screen__in=screens)
+    if exclude_show is not None:
+        links = links.exclude(show_id=exclude_show)
+
+    intervals = defaultdict(list)
+    rows = links.values_list(
+        'show__screen_id', 'show_id', 'program_id',
+        'program__day', 'program__hour', 'show__movie__duration')
+    for screen_id, show_id, program_id, day, hour, duration in rows:
+        intervals[screen_id].append(show_interval(day, hour, duration, show_id, program_id))
+    return intervals
+
+class ScreenSchedule:
+    """
+    The intervals during which a screen is occupied, sorted by start.
+    Overlap checks only look at the intervals that start less than the
+    longest interval before the checked one, so they do not scan the whole schedule.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=attrgetter('start', 'end'))
+        self.starts = [interval.start for interval in self.intervals]
+        self.longest = max((interval.end - interval.start for interval in self.intervals),
+                           default=datetime.timedelta(0))
+
+    @classmethod
+    def load(cls, screen, first_day, last_day, exclude_show=None):
+        """Returns the schedule of a screen between the two days, loaded with one query."""
+        intervals = _load_intervals(first_day, last_day, [screen], exclude_show)
+        return cls(intervals[screen.id])
+
+    def add(self, interval):
+        """Adds an interval to the schedule."""
+        index = bisect.bisect_right(self.starts, interval.start)
+        self.intervals.insert(index, interval)
+        self.starts.insert(index, interval.start)
+        self.longest = max(self.longest, interval.end - interval.start)
+
+    def overlapping(self, interval):
+        """Returns the intervals of the schedule that overlap with the given one."""
+        low = bisect.bisect_right(self.starts, interval.start - self.longest)
+        high = bisect.bisect_left(self.starts, interval.end)
+        return [other for other in self.intervals[low:high] if other.end > interval.start]
+
+    def conflicts(self):
+        """Returns every pair of overlapping intervals of the schedule, with one sweep over it."""
+        conflicts = []
+        running = []
+        for interval in self.intervals:
+            running = [other for other in running if other.end > interval.start]
+            conflicts.extend((other, interval) for other in running)
+            running.append(interval)
+        return conflicts
+
+def schedule_conflicts(first_day, last_day, screens=None):
+    """
+    Checks the schedule of all the screens, or of the given ones, between the two days
+    and returns a dict of screen id to the pairs of shows that overlap.
+    """
+    conflicts = {}
+    for screen_id, intervals in _load_intervals(first_day, last_day, screens).items():
+        pairs = [
+            (first, second) for first, second in ScreenSchedule(intervals).conflicts()
+            if second.start.date() >= first_day
+        ]
+        if pairs:
+            conflicts[screen_id] = pairs
+    return conflicts
+
+def batch_conflicts(intervals):
+    """
+    Checks a batch of new {screen id: [intervals]} against each other and against the shows
+    of their screens, loaded with one query, and returns a dict of screen id to the pairs
+    of overlapping intervals in which at least one is new.
+    """
+    starts = [interval.start.date() for screen in intervals.values() for interval in screen]
+    if not starts:
+        return {}
+    # A new show late on the last day may run into the shows of the next one.
+    existing = _load_intervals(min(starts), max(starts) + datetime.timedelta(1), list(intervals))
+    conflicts = {}
+    for screen_id, new in intervals.items():
+        pairs = [
+            (first, second)
+            for first, second in ScreenSchedule(existing[screen_id] + new).conflicts()
+            if first.line is not None or second.line is not None
+        ]
+        if pairs:
+            conflicts[screen_id] = pairs
+    return conflicts
@@ -0,0 +1,371 @@
+"""
+MovieSearchIndex finds movies by the words of their name, director, cast, genres, language
+and description. It keeps, in memory, an inverted index from every word to the movies that
+contain it, weighted by the field it appears in, and a sorted list of the words, so that the
+words starting with a prefix are found with a binary search. Words are compared without case
+and accents, so that "ΤΑΙΝΙΑ", "ταινία" and "ταινια" match, as do "Amélie" and "amelie".
+The index is loaded on first use, updated from the signals of Movie and Genre, and reloaded
+every RELOAD_AFTER seconds so that changes made by other processes are picked up. A new index
+is built without holding the lock of the one in use, which keeps answering searches meanwhile,
+and is swapped in once it is complete; a reload is built in a background thread.
+"""
+
+import re
+import time
+import heapq
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+from django.db import connection
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from .models import Genre, Movie
+
+# Seconds after which the index is loaded again from the database.
+RELOAD_AFTER = 10*60
+
+# Weight of a word found in each field; a movie's score is the sum over the words of the query.
+FIELD_WEIGHTS = {
+    'name': 10,
+    'director': 4,
+    'cast': 3,
+    'genre': 3,
+    'language': 2,
+    'description': 1,
+}
+
+# The fields stored in Movie itself; genre is the names of its genres.
+MOVIE_FIELDS = ('name', 'director', 'cast', 'language', 'description')
+
+# Words shorter than this only match whole words, not as prefixes.
+MIN_PREFIX = 2
+
+# Most words a prefix is expanded to, so that short prefixes stay fast.
+MAX_EXPANSIONS = 50
+
+# Part of its weight a word keeps when it only matches a prefix of the query.
+PREFIX_FACTOR = 0.5
+
+WORD_RE = re.compile(r'\w+')
+
+# The combining diacritical marks, e.g. the Greek tonos and dialytika, left by NFKD.
+ACCENT_RE = re.compile('[\u0300-\u036f]')
+
+def normalize(text):
+    """
+    Returns text without accents and in case-folded form. Case folding also turns
+    the final sigma into σ, so that "ταινίας" and "ταινιασ" are the same word.
+    """
+    return ACCENT_RE.sub('', unicodedata.normalize('NFKD', text or '')).casefold()
+
+def words(text):
+    """Returns the normalized words of a text."""
+    return WORD_RE.findall(normalize(text))
+
+def _contains(sequence, part):
+    """Returns whether a list of words contains another list of words in a row."""
+    return any(sequence[start:start + len(part)] == part
+               for start in range(len(sequence) - len(part) + 1))
+
+class MovieSearchIndex:
+    """Inverted index from words to movies, with the words sorted for prefix search."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held by the thread that builds a new index, so that only one is built at a time.
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        # The changes made while a new index is built, to be applied to it as well.
+        self._pending = None
+        self.clear()
+
+    @property
+    def loaded(self):
+        """Whether the index has been loaded from the database."""
+        return self._loaded_at is not None
+
+    def clear(self):
+        """Empties the index."""
+        with self._lock:
+            self._fields = {}
+            self._weights = {}
+            self._postings = defaultdict(dict)
+            self._ranking = {}
+            self._words = []
+            self._scores = {}
+
+    def load(self):
+        """Loads every movie and the names of its genres with two queries."""
+        self.fill(Movie.objects.values_list('id', *MOVIE_FIELDS, 'rating', 'year'),
+                  Movie.genre.through.objects.values_list('movie_id', 'genre__name'))
+
+    def fill(self, movies, links):
+        """
+        Replaces the index with (id, name, director, cast, language, description, rating, year)
+        movies and (movie id, genre name) links. The new index is built apart and swapped in,
+        with the changes made meanwhile applied to it.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            genres = defaultdict(list)
+            for movie_id, genre in links:
+                genres[movie_id].append(genre)
+            # Added by rating and year, the movies of every word are in that order already, and
+            # ranking them by weight is a stable sort that keeps it for the movies of equal weight.
+            movies = sorted(movies, reverse=True,
+                            key=lambda movie: (float(movie[-2] or 0), movie[-1] or 0))
+            built = MovieSearchIndex()
+            for movie_id, *fields, rating, year in movies:
+                built._fields[movie_id] = dict(zip(MOVIE_FIELDS, fields),
+                                               genre=' '.join(genres[movie_id]))
+                built._scores[movie_id] = (float(rating or 0), year or 0)
+                built._index(movie_id)
+            built._words = sorted(built._postings)
+            # Ranked now, so that no search has to sort the movies of a common word.
+            for word, postings in built._postings.items():
+                built._ranking[word] = sorted(postings, key=postings.__getitem__, reverse=True)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for method, args in self._pending:
+                getattr(built, method)(*args)
+            self._pending = None
+            self._fields, self._weights, self._scores = built._fields, built._weights, built._scores
+            self._postings, self._ranking, self._words = (
+                built._postings, built._ranking, built._words)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        """
+        Loads the index on first use, which the searches wait for, and starts reloading it in
+        a background thread once it is older than RELOAD_AFTER, answering from it meanwhile.
+        """
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+        elif (time.monotonic() - self._loaded_at > RELOAD_AFTER
+              and self._load_lock.acquire(blocking=False)):
+            threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        """Loads the index again, in the background thread started by _ensure_loaded."""
+        try:
+            self.load()
+        finally:
+            self._load_lock.release()
+            connection.close()
+
+    def _record(self, method, *args):
+        """Keeps a change to apply it to the index being built, if there is one."""
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def _index(self, movie_id):
+        """Adds the words of a movie's fields to the postings."""
+        weights = defaultdict(int)
+        for field, text in self._fields[movie_id].items():
+            for word in set(words(text)):
+                weights[word] = weights[word] + FIELD_WEIGHTS[field]
+        self._weights[movie_id] = weights
+        for word, weight in weights.items():
+            self._postings[word][movie_id] = weight
+            self._ranking.pop(word, None)
+
+    def _unindex(self, movie_id):
+        """Removes the words of a movie from the postings, and the words left without movies."""
+        for word in self._weights.pop(movie_id, ()):
+            postings = self._postings[word]
+            postings.pop(movie_id, None)
+            self._ranking.pop(word, None)
+            if not postings:
+                del self._postings[word]
+                position = bisect.bisect_left(self._words, word)
+                if position < len(self._words) and self._words[position] == word:
+                    del self._words[position]
+
+    def _reindex(self, movie_id):
+        """Indexes the fields of a movie again, keeping the word list sorted."""
+        self._unindex(movie_id)
+        self._index(movie_id)
+        for word in self._weights[movie_id]:
+            position = bisect.bisect_left(self._words, word)
+            if position == len(self._words) or self._words[position] != word:
+                self._words.insert(position, word)
+
+    def genres(self, movie_id):
+        """Returns the genre names of a movie, as indexed."""
+        return self._fields.get(movie_id, {}).get('genre', '')
+
+    def add(self, movie_id, fields, rating, year):
+        """Adds a movie with the given {field: text} to the index, or updates it."""
+        with self._lock:
+            self._record('add', movie_id, fields, rating, year)
+            self._fields[movie_id] = dict(self._fields.get(movie_id, {}), **fields)
+            self._fields[movie_id].setdefault('genre', '')
+            self._scores[movie_id] = (float(rating or 0), year or 0)
+            self._reindex(movie_id)
+
+    def set_genres(self, movie_id, genres):
+        """Replaces the genre names of a movie."""
+        with self._lock:
+            self._record('set_genres', movie_id, genres)
+            if movie_id in self._fields:
+                self._fields[movie_id]['genre'] = ' '.join(genres)
+                self._reindex(movie_id)
+
+    def with_genre(self, name):
+        """Returns the ids of the movies indexed with a genre name."""
+        with self._lock:
+            genre = words(name)
+            return [movie_id for movie_id, fields in self._fields.items()
+                    if genre and _contains(words(fields['genre']), genre)]
+
+    def remove(self, movie_id):
+        """Removes a movie from the index."""
+        with self._lock:
+            self._record('remove', movie_id)
+            self._unindex(movie_id)
+            self._fields.pop(movie_id, None)
+            self._scores.pop(movie_id, None)
+
+    def _matches(self, word):
+        """
+        Returns the indexed words that a word of a query matches, with the part of their weight
+        they keep: the word itself and, unless it is too short, the words it is a prefix of.
+        """
+        matches = []
+        if word in self._postings:
+            matches.append((word, 1))
+        if len(word) >= MIN_PREFIX:
+            position = bisect.bisect_right(self._words, word)
+            while (position < len(self._words) and len(matches) < MAX_EXPANSIONS
+                   and self._words[position].startswith(word)):
+                matches.append((self._words[position], PREFIX_FACTOR))
+                position = position + 1
+        return matches
+
+    def _ranked(self, word):
+        """Returns the movies of an indexed word by weight, then by rating and year, best first."""
+        ranked = self._ranking.get(word)
+        if ranked is None:
+            postings = self._postings[word]
+            ranked = sorted(postings, reverse=True,
+                            key=lambda movie_id: (postings[movie_id],) + self._scores.get(movie_id, (0, 0)))
+            self._ranking[word] = ranked
+        return ranked
+
+    def _stream(self, word, factor):
+        """Yields the (score, rating, year) and id of the movies of an indexed word, best first."""
+        postings = self._postings[word]
+        for movie_id in self._ranked(word):
+            yield (postings[movie_id] * factor,) + self._scores.get(movie_id, (0, 0)), movie_id
+
+    def _best(self, terms):
+        """Returns the most a movie can score for a word of a query."""
+        return max(self._postings[term][self._ranked(term)[0]] * factor for term, factor in terms)
+
+    def _score(self, terms, movie_id):
+        """Returns the score of a movie for a word of a query, or None if it does not match it."""
+        best = None
+        for term, factor in terms:
+            weight = self._postings[term].get(movie_id)
+            if weight is not None and (best is None or weight * factor > best):
+                best = weight * factor
+        return best
+
+    def search(self, query, limit=20):
+        """
+        Returns the ids of the movies that match every word of a query, as a word or as
+        a prefix of a word, best first. A movie scores the weights of the fields its words
+        are found in; movies with the same score are ranked by rating, then by year.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            matches = [self._matches(word) for word in set(words(query))]
+            if not matches or not all(matches):
+                return []
+            # The candidates come from the rarest word, best first, and the others only score them.
+            matches.sort(key=lambda terms: sum(len(self._postings[term]) for term, _ in terms))
+            first, others = matches[0], matches[1:]
+            rest = sum(self._best(terms) for terms in others)
+
+            best = []
+            seen = set()
+            for (score, rating, year), movie_id in heapq.merge(
+                    *(self._stream(term, factor) for term, factor in first), reverse=True):
+                # No movie further down can beat the ones found, so the rest are not scored.
+                if len(best) == limit and best[0][:3] >= (score + rest, rating, year):
+                    break
+                if movie_id in seen:
+                    continue
+                seen.add(movie_id)
+                for terms in others:
+                    word_score = self._score(terms, movie_id)
+                    if word_score is None:
+                        break
+                    score = score + word_score
+                else:
+                    entry = (score, rating, year, movie_id)
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+            return [entry[-1] for entry in sorted(best, reverse=True)]
+
+index = MovieSearchIndex()
+
+def _genre_names(movie_ids):
+    """Returns the genre names of the given movies, with one query."""
+    genres = defaultdict(list)
+    for movie_id, genre in Movie.genre.through.objects.filter(
+            movie_id__in=movie_ids).values_list('movie_id', 'genre__name'):
+        genres[movie_id].append(genre)
+    return genres
+
+def update_movie(sender, instance, **kwargs):
+    """Indexes the fields of a saved movie."""
+    if index.loaded:
+        fields = {field: getattr(instance, field) for field in MOVIE_FIELDS}
+        index.add(instance.id, fields, instance.rating, instance.year)
+
+def remove_movie(sender, instance, **kwargs):
+    """Removes a deleted movie."""
+    if index.loaded:
+        index.remove(instance.id)
+
+def _update_genres(movie_ids):
+    genres = _genre_names(movie_ids)
+    for movie_id in movie_ids:
+        index.set_genres(movie_id, genres[movie_id])
+
+def update_genre(sender, instance, **kwargs):
+    """Indexes again the movies of a renamed genre."""
+    if index.loaded:
+        _update_genres(list(instance.movie_set.values_list('id', flat=True)))
+
+def remove_genre(sender, instance, **kwargs):
+    """Indexes again the movies of a deleted genre, whose links are gone already."""
+    if index.loaded:
+        _update_genres(index.with_genre(instance.name))
+
+def update_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    """Indexes again the genres of the movies whose genres changed."""
+    if not index.loaded or not action.startswith('post'):
+        return
+    if not reverse:
+        _update_genres([instance.id])
+    elif action == 'post_clear':
+        _update_genres(index.with_genre(instance.name))
+    else:
+        _update_genres(pk_set)
+
+post_save.connect(update_movie, sender=Movie)
+post_delete.connect(remove_movie, sender=Movie)
+post_save.connect(update_genre, sender=Genre)
+post_delete.connect(remove_genre, sender=Genre)
+m2m_changed.connect(update_genres, sender=Movie.genre.through)
@@ -1,27 +1,98 @@
 """
-SEAT_1 and SEAT_2 are 2d arrays which represent the seating plan of the theaters' screens.
+The seating plans of the theaters' screens are 2d arrays loaded from the JSON files of the
+seating directory, one file per plan named after it (e.g. seating/SEAT_1.json).
 0 indicates that there is no seat in that position, meaning that there is a corridor.
+Every plan is validated once, when this module is imported, and turned into a Layout
+that keeps everything the views and signals need, so they never walk the array again.
 """
 
-SEAT_1 = [
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-    [1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1],
-]
-
-SEAT_2 = [
-    [1, 1, 0, 1, 1],
-    [1, 1, 0, 1, 1],
-    [1, 1, 0, 1, 1],
-    [1, 1, 0, 1, 1],
-    [1, 1, 0, 1, 1],
-    [1, 1, 0, 1, 1],
-]
-
-SEATING_ARRAYS = {'SEAT_1': SEAT_1, 'SEAT_2':SEAT_2}
+import os
+import json
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from .choices import SEATING_PATTERNS
+from .seatmap import SeatBitmap, format_position
+
+SEATING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seating')
+
+class Layout:
+    """
+    A validated seating plan, with its size, the (row, col) coordinates and position strings
+    of its seats counting from 1, the states of a seat map where every seat is available,
+    and the HTML of the seat selection grid.
+    """
+
+    def __init__(self, name, pattern):
+        self.name = name
+        self.pattern = [list(cols) for cols in pattern]
+        self.rows = len(pattern)
+        self.cols = len(pattern[0])
+        self.seats = [
+            (row+1, col+1)
+            for row, cols in enumerate(pattern)
+            for col, seat in enumerate(cols) if seat
+        ]
+        self.positions = [format_position(row, col) for row, col in self.seats]
+        self.seat_count = len(self.seats)
+        self.states = bytes(SeatBitmap.from_pattern(pattern).data)
+        self.grid_html = self._render_grid()
+
+    def bitmap(self):
+        """Returns a new seat bitmap where every seat is available."""
+        return SeatBitmap(self.rows, self.cols, self.states)
+
+    def _render_grid(self):
+        """
+        Returns the seat selection grid: a checkbox with id and value "row,col" for every seat
+        and a blank for every corridor. The states of the seats are applied by the page.
+        """
+        corridor = mark_safe('<a> &emsp;</a>')
+        rows = []
+        for row, cols in enumerate(self.pattern, 1):
+            cells = []
+            for col, seat in enumerate(cols, 1):
+                if seat:
+                    cells.append(format_html(
+                        '<label><input id="{0},{1}" type="checkbox" name="seat" value="{0},{1}">'
+                        '<span id="seatBut,{0},{1}" class="seatButton1"> {0},{1} </span></label>',
+                        row, col))
+                else:
+                    cells.append(corridor)
+            rows.append(format_html('<div class="H1toH5">{}</div>{}',
+                                    mark_safe(''.join(cells)), corridor))
+        return format_html_join('\n', '{}', ((row,) for row in rows))
+
+def validate(name, pattern):
+    """Raises ImproperlyConfigured unless a seating plan is a non-empty rectangle of 0s and 1s with seats."""
+    if not isinstance(pattern, list) or not pattern or not all(
+            isinstance(cols, list) and cols for cols in pattern):
+        raise ImproperlyConfigured(f"Seating plan {name} must be a non-empty list of rows.")
+    if len({len(cols) for cols in pattern}) != 1:
+        raise ImproperlyConfigured(f"The rows of seating plan {name} must have the same length.")
+    if any(seat not in (0, 1) or isinstance(seat, bool) for cols in pattern for seat in cols):
+        raise ImproperlyConfigured(f"Seating plan {name} may only contain 0 and 1.")
+    if not any(seat for cols in pattern for seat in cols):
+        raise ImproperlyConfigured(f"Seating plan {name} has no seats.")
+
+def load_layouts(directory=SEATING_DIR):
+    """Loads and validates the seating plans of a directory, and returns their layouts by name."""
+    layouts = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension != '.json':
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as data:
+                pattern = json.load(data)
+        except ValueError as error:
+            raise ImproperlyConfigured(f"Seating plan {filename} is not valid JSON: {error}")
+        validate(name, pattern)
+        layouts[name] = Layout(name, pattern)
+
+    missing = [name for name, _ in SEATING_PATTERNS if name not in layouts]
+    if missing:
+        raise ImproperlyConfigured(f"No seating plan file for {', '.join(missing)}.")
+    return layouts
+
+LAYOUTS = load_layouts()
@@ -0,0 +1,90 @@
+"""
+SeatBitmap packs the state of every position of a screen's seating pattern in a byte array,
+using 2 bits per position. The state codes are the ones of SEAT_CHOICES, and 0 marks a
+position without a seat (corridor). Positions are given as (row, col), counting from 1
+like the positions of the Seat entries.
+"""
+
+AVAILABLE = 1
+RESERVED = 2
+UNAVAILABLE = 3
+NO_SEAT = 0
+
+BITS_PER_SEAT = 2
+SEATS_PER_BYTE = 8 // BITS_PER_SEAT
+STATE_MASK = 0b11
+
+def parse_position(position):
+    """Returns the (row, col) tuple of a position string such as '3, 7' or '3,7'."""
+    row, col = position.split(',')
+    return int(row), int(col)
+
+def format_position(row, col):
+    """Returns the position string of a seat, as it is stored in Seat and ShowSeat."""
+    return f"{str(row)}, {str(col)}"
+
+def _popcount(value):
+    """Returns the number of set bits of an integer."""
+    return bin(value).count('1')
+
+class SeatBitmap:
+    """Seat states of a (show, program) packed 4 seats per byte."""
+
+    def __init__(self, rows, cols, data=None):
+        self.rows = rows
+        self.cols = cols
+        size = (rows * cols + SEATS_PER_BYTE - 1) // SEATS_PER_BYTE
+        self.data = bytearray(data) if data is not None else bytearray(size)
+        if len(self.data) != size:
+            raise ValueError(f"Expected {size} bytes for a {rows}x{cols} seat map.")
+
+    @classmethod
+    def from_pattern(cls, seating_pattern):
+        """Returns a bitmap where every seat of the seating pattern is available."""
+        bitmap = cls(len(seating_pattern), max(len(cols) for cols in seating_pattern))
+        for row, cols in enumerate(seating_pattern):
+            for col, seat in enumerate(cols):
+                if seat:
+                    bitmap.set(row+1, col+1, AVAILABLE)
+        return bitmap
+
+    def _index(self, row, col):
+        if not (1 <= row <= self.rows and 1 <= col <= self.cols):
+            raise IndexError(f"Seat {row}, {col} is outside of the seat map.")
+        return (row-1) * self.cols + (col-1)
+
+    def get(self, row, col):
+        """Returns the state code of a position."""
+        index = self._index(row, col)
+        shift = (index % SEATS_PER_BYTE) * BITS_PER_SEAT
+        return (self.data[index // SEATS_PER_BYTE] >> shift) & STATE_MASK
+
+    def set(self, row, col, state):
+        """Sets the state code of a position."""
+        index = self._index(row, col)
+        shift = (index % SEATS_PER_BYTE) * BITS_PER_SEAT
+        byte = self.data[index // SEATS_PER_BYTE] & ~(STATE_MASK << shift)
+        self.data[index // SEATS_PER_BYTE] = byte | ((state & STATE_MASK) << shift)
+
+    def count(self, state):
+        """Returns the number of positions that are in the given state, using popcounts."""
+        value = int.from_bytes(self.data, 'little')
+        low_mask = int.from_bytes(b'\x55' * len(self.data), 'little')
+        low = value & low_mask
+        high = (value >> 1) & low_mask
+        if state == NO_SEAT:
+            return self.rows * self.cols - _popcount(low | high)
+        if state == AVAILABLE:
+            return _popcount(low & ~high)
+        if state == RESERVED:
+            return _popcount(high & ~low)
+        return _popcount(low & high)
+
+    def as_rows(self):
+        """Returns the state codes as a list of rows, which is what the seat page renders."""
+        return [[self.get(row, col) for col in range(1, self.cols+1)]
+                for row in range(1, self.rows+1)]
+
+    def to_bytes(self):
+        """Returns the packed states, as they are stored in SeatMap.states."""
+        return bytes(self.data)
@@ -0,0 +1,41 @@
+"""
+The poster tag renders a movie's poster as a picture element whose srcset lists the resized
+variants generated by movies.images, so that browsers download the smallest one that fits.
+"""
+
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from movies.images import FORMATS, variant_name, variant_urls
+
+register = template.Library()
+
+# The width at which each kind of poster is displayed, for the sizes attribute.
+SIZES = {
+    'thumb': '160px',
+    'card': '(max-width: 600px) 50vw, 360px',
+    'hero': '100vw',
+}
+
+def _srcset(image_hash, extension):
+    return format_html_join(', ', '{} {}w', variant_urls(image_hash, extension))
+
+@register.simple_tag
+def poster(movie, size='card'):
+    """
+    Renders the poster of a movie, displayed at the given size (thumb, card or hero).
+    Posters whose variants have not been generated yet are rendered from the original image.
+    """
+    if not movie.image:
+        return ''
+    if not movie.image_hash:
+        return format_html('<img src="{}" alt="{}">', movie.image.url, movie.name)
+
+    sources = format_html_join('', '<source type="image/{}" srcset="{}" sizes="{}">', (
+        (extension, _srcset(movie.image_hash, extension), SIZES[size])
+        for extension, _ in FORMATS if extension != 'jpg'
+    ))
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}"></picture>',
+        sources, default_storage.url(variant_name(movie.image_hash, size, 'jpg')),
+        _srcset(movie.image_hash, 'jpg'), SIZES[size], movie.name)
@@ -0,0 +1,542 @@
+"""
+The following tests cover the seat bitmaps, the screen schedules, the show form,
+the movie search index, the typeahead tries, the number of queries of the pages built from the cached catalog
+and the schedule import.
+"""
+
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import threading
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from .forms import ShowForm
+from . import catalog
+from .management.commands import import_schedule
+from .models import Movie, Theater, Screen, Seat, SeatMap, Show, ShowSeat, Program
+from .seatmap import (AVAILABLE, RESERVED, UNAVAILABLE, NO_SEAT, SeatBitmap,
+                      format_position, parse_position)
+from .search import MovieSearchIndex
+from .typeahead import MAX_DEPTH, PrefixTrie, _theater_entry
+from .scheduling import (BREAK, ScreenSchedule, batch_conflicts, schedule_conflicts,
+                         show_interval)
+
+DAY = datetime.date(2030, 1, 7)
+
+def create_theater(name='Test'):
+    """Creates a theater."""
+    return Theater.objects.create(
+        name=name, city='Test', county='Νομός Αττικής', address='Test', zipcode='00000')
+
+def create_movie(name='Test', duration=120):
+    """Creates a movie that lasts duration minutes."""
+    return Movie.objects.create(
+        name=name, description='Test', year=2000, rating=5, duration=duration,
+        director='Test', cast='Test')
+
+def create_screen(theater, seating_pattern='SEAT_2'):
+    """Creates a screen, which creates its seats."""
+    return Screen.objects.create(
+        name='Test', no_rows=0, no_cols=0, no_seats=0,
+        seating_pattern=seating_pattern, theater=theater)
+
+def create_show(movie, screen, *programs, price=9):
+    """Creates a show of a movie on a screen for the given programs."""
+    show = Show.objects.create(movie=movie, theater=screen.theater, screen=screen, price=price)
+    show.program.add(*programs)
+    return show
+
+def program(day, hour, minute=0):
+    """Returns the program of a day and hour, creating it if needed."""
+    return Program.objects.get_or_create(day=day, hour=datetime.time(hour, minute))[0]
+
+def interval(day, hour, minute=0, duration=120, show_id=None):
+    """Returns the interval of a show starting at a day and time."""
+    return show_interval(day, datetime.time(hour, minute), duration, show_id)
+
+class SeatBitmapTests(SimpleTestCase):
+    """Packing of the seat states."""
+
+    def test_states_do_not_leak_into_neighbours(self):
+        """Every state of every position reads back, across byte boundaries."""
+        bitmap = SeatBitmap(3, 5)
+        states = [AVAILABLE, RESERVED, UNAVAILABLE, NO_SEAT]
+        for index in range(15):
+            bitmap.set(index // 5 + 1, index % 5 + 1, states[index % 4])
+        self.assertEqual(
+            [bitmap.get(index // 5 + 1, index % 5 + 1) for index in range(15)],
+            [states[index % 4] for index in range(15)])
+        bitmap.set(2, 3, AVAILABLE)
+        self.assertEqual((bitmap.get(2, 2), bitmap.get(2, 3), bitmap.get(2, 4)),
+                         (UNAVAILABLE, AVAILABLE, AVAILABLE))
+
+    def test_counts(self):
+        """The popcounts agree with counting the positions one by one."""
+        bitmap = SeatBitmap.from_pattern([[1, 1, 0, 1], [1, 0, 1, 1], [1, 1, 1]])
+        bitmap.set(1, 1, RESERVED)
+        bitmap.set(2, 4, UNAVAILABLE)
+        bitmap.set(2, 3, UNAVAILABLE)
+        cells = [state for row in bitmap.as_rows() for state in row]
+        for state in (NO_SEAT, AVAILABLE, RESERVED, UNAVAILABLE):
+            self.assertEqual(bitmap.count(state), cells.count(state))
+        # The short last row is padded with positions without a seat.
+        self.assertEqual(bitmap.get(3, 4), NO_SEAT)
+        self.assertEqual(bitmap.count(NO_SEAT), 3)
+
+    def test_size_that_is_not_a_multiple_of_a_byte(self):
+        """The padding bits of the last byte are never counted as seats."""
+        bitmap = SeatBitmap.from_pattern([[1] * 7])
+        self.assertEqual(len(bitmap.to_bytes()), 2)
+        self.assertEqual(bitmap.count(AVAILABLE), 7)
+        self.assertEqual(bitmap.count(NO_SEAT), 0)
+
+    def test_round_trip(self):
+        bitmap = SeatBitmap(2, 3)
+        bitmap.set(2, 3, RESERVED)
+        copy = SeatBitmap(2, 3, bitmap.to_bytes())
+        self.assertEqual(copy.as_rows(), bitmap.as_rows())
+
+    def test_wrong_size_or_position(self):
+        with self.assertRaises(ValueError):
+            SeatBitmap(2, 3, b'\x00' * 5)
+        bitmap = SeatBitmap(2, 3)
+        for row, col in ((0, 1), (3, 1), (1, 0), (1, 4)):
+            with self.assertRaises(IndexError):
+                bitmap.get(row, col)
+
+    def test_positions(self):
+        self.assertEqual(parse_position('3, 7'), (3, 7))
+        self.assertEqual(parse_position('3,7'), (3, 7))
+        self.assertEqual(format_position(3, 7), '3, 7')
+
+class ScreenScheduleTests(SimpleTestCase):
+    """Overlap checks on intervals, without the database."""
+
+    def test_break_is_part_of_the_interval(self):
+        """A show may start once the previous one and the break are over, not before."""
+        schedule = ScreenSchedule([interval(DAY, 20)])
+        end = datetime.datetime.combine(DAY, datetime.time(20)) + datetime.timedelta(minutes=120)
+        free = end + BREAK
+        self.assertEqual(schedule.overlapping(interval(free.date(), free.hour, free.minute)), [])
+        early = free - datetime.timedelta(minutes=1)
+        self.assertEqual(len(schedule.overlapping(interval(early.date(), early.hour, early.minute))), 1)
+
+    def test_show_past_midnight_overlaps_the_next_day(self):
+        """A late show keeps the screen busy after midnight."""
+        schedule = ScreenSchedule([interval(DAY, 23)])
+        next_day = DAY + datetime.timedelta(1)
+        self.assertEqual(len(schedule.overlapping(interval(next_day, 1))), 1)
+        self.assertEqual(schedule.overlapping(interval(next_day, 2)), [])
+
+    def test_long_show_is_found_from_far_back(self):
+        """A long show that started well before a short one still overlaps with it."""
+        schedule = ScreenSchedule([interval(DAY, 10, duration=600), interval(DAY, 18, duration=60)])
+        self.assertEqual(
+            [other.start.hour for other in schedule.overlapping(interval(DAY, 15, duration=30))],
+            [10])
+
+    def test_add_keeps_the_schedule_sorted(self):
+        """Intervals added out of order are found like the ones given at first."""
+        schedule = ScreenSchedule([interval(DAY, 20)])
+        schedule.add(interval(DAY, 10, duration=600))
+        self.assertEqual([other.start.hour for other in schedule.intervals], [10, 20])
+        self.assertEqual(len(schedule.overlapping(interval(DAY, 12))), 1)
+
+    def test_conflicts_lists_every_pair(self):
+        """Three shows at the same time give three pairs, and shows far apart none."""
+        schedule = ScreenSchedule([interval(DAY, 20, show_id=show_id) for show_id in (1, 2, 3)]
+                                  + [interval(DAY, 10, show_id=4)])
+        pairs = {(first.show_id, second.show_id) for first, second in schedule.conflicts()}
+        self.assertEqual(len(pairs), 3)
+        self.assertFalse(any(4 in pair for pair in pairs))
+
+    def test_empty_schedule(self):
+        """An empty schedule has no conflicts and overlaps with nothing."""
+        schedule = ScreenSchedule()
+        self.assertEqual(schedule.conflicts(), [])
+        self.assertEqual(schedule.overlapping(interval(DAY, 20)), [])
+
+class MovieSearchIndexTests(SimpleTestCase):
+    """Searches of an index filled in memory, without the database."""
+
+    def movie(self, movie_id, name, description='', rating=5, year=2000, director='', cast=''):
+        """Returns a movie as the index loads it."""
+        return (movie_id, name, director, cast, 'Greek', description, rating, year)
+
+    def index(self, *movies, links=()):
+        index = MovieSearchIndex()
+        index.fill(movies, links)
+        return index
+
+    def test_accents_case_and_final_sigma(self):
+        index = self.index(self.movie(1, 'Η ταινία της χρονιάς'), self.movie(2, 'Amélie'))
+        for query in ('ΤΑΙΝΙΑ', 'ταινια', 'χρονιασ', 'ΧΡΟΝΙΆΣ'):
+            self.assertEqual(index.search(query), [1], query)
+        self.assertEqual(index.search('AMELIE'), [2])
+
+    def test_prefixes(self):
+        index = self.index(self.movie(1, 'Amélie'), self.movie(2, 'A Star'))
+        self.assertEqual(index.search('amel'), [1])
+        self.assertEqual(index.search('am'), [1])
+        # Shorter than MIN_PREFIX, a word only matches whole words.
+        self.assertEqual(index.search('s'), [])
+        self.assertEqual(index.search('a'), [2])
+
+    def test_every_word_must_match(self):
+        index = self.index(self.movie(1, 'Night City'), self.movie(2, 'Night River'))
+        self.assertEqual(index.search('night riv'), [2])
+        self.assertEqual(index.search('night sea'), [])
+
+    def test_ranking(self):
+        """The name weighs most, a whole word beats a prefix, then rating and year decide."""
+        index = self.index(
+            self.movie(1, 'Storm', description='star'),
+            self.movie(2, 'Star', rating=6),
+            self.movie(3, 'Star', rating=7, year=1990),
+            self.movie(4, 'Star', rating=7, year=2010),
+            self.movie(5, 'Stars', rating=9),
+        )
+        self.assertEqual(index.search('star'), [4, 3, 2, 5, 1])
+        self.assertEqual(index.search('star', limit=2), [4, 3])
+
+    def test_changes_match_a_fresh_fill(self):
+        """Movies added, changed and removed one by one are found as if the index was filled again."""
+        index = self.index(self.movie(1, 'Night City'), self.movie(2, 'Summer Night'),
+                           links=[(1, 'Drama')])
+        index.add(3, {'name': 'City Lights', 'director': 'Chaplin'}, 8, 1931)
+        index.add(2, {'name': 'Summer Storm'}, 5, 2000)
+        index.set_genres(3, ['Comedy', 'Drama'])
+        index.remove(1)
+        fresh = self.index(self.movie(2, 'Summer Storm'),
+                           self.movie(3, 'City Lights', rating=8, year=1931, director='Chaplin'),
+                           links=[(3, 'Comedy'), (3, 'Drama')])
+        for query in ('night', 'city', 'summer', 'storm', 'drama', 'comedy', 'chap', 'li', 's'):
+            self.assertEqual(index.search(query), fresh.search(query), query)
+        self.assertEqual(index._words, fresh._words)
+
+    def test_searches_are_answered_while_the_index_is_built(self):
+        """A new index is built without the lock, and the changes made meanwhile are kept."""
+        index = self.index(self.movie(1, 'Night City'))
+        found = []
+
+        def movies():
+            searcher = threading.Thread(target=lambda: found.append(index.search('night')))
+            searcher.start()
+            searcher.join(5)
+            index.add(3, {'name': 'Night Train'}, 5, 2000)
+            yield self.movie(1, 'Night City')
+            yield self.movie(2, 'Night River')
+
+        index.fill(movies(), [])
+        self.assertEqual(found, [[1]])
+        self.assertEqual(sorted(index.search('night')), [1, 2, 3])
+
+class PrefixTrieTests(SimpleTestCase):
+    """Suggestions of a trie filled in memory, without the database."""
+
+    def trie(self, *entries):
+        trie = PrefixTrie(lambda: ())
+        trie.fill(entries)
+        return trie
+
+    def theaters(self):
+        return self.trie(_theater_entry(1, 'Village', 'Αθήνα', 'Νομός Αττικής'),
+                         _theater_entry(2, 'Odeon', 'Θεσσαλονίκη', 'Νομός Θεσσαλονίκης'),
+                         _theater_entry(3, 'Ster Cinemas', 'Αθήνα', 'Νομός Αττικής'))
+
+    def test_every_word_of_name_city_and_county(self):
+        trie = self.theaters()
+        self.assertEqual(trie.suggest('vil'), [(1, 'Village, Αθήνα')])
+        self.assertEqual(trie.suggest('ΑΘΗ'), [(3, 'Ster Cinemas, Αθήνα'), (1, 'Village, Αθήνα')])
+        self.assertEqual(trie.suggest('αττικ ster'), [(3, 'Ster Cinemas, Αθήνα')])
+        self.assertEqual(trie.suggest('νομος θεσ'), [(2, 'Odeon, Θεσσαλονίκη')])
+        self.assertEqual(trie.suggest('odeon αθ'), [])
+        self.assertEqual(trie.suggest('  '), [])
+
+    def test_labels_starting_with_the_query_come_first(self):
+        trie = self.trie((1, 'Night Star', 'Night Star'), (2, 'Star Wars', 'Star Wars'))
+        self.assertEqual([entry_id for entry_id, _ in trie.suggest('star')], [2, 1])
+
+    def test_allowed(self):
+        trie = self.theaters()
+        self.assertEqual(trie.suggest('αθήνα', allowed=[1, 2]), [(1, 'Village, Αθήνα')])
+        self.assertEqual(trie.suggest('αθήνα', allowed=()), [])
+
+    def test_remove_prunes_the_nodes(self):
+        trie = self.trie((1, 'Stars', 'Stars'), (2, 'Storm', 'Storm'))
+        trie.remove(2)
+        self.assertEqual(trie.suggest('st'), [(1, 'Stars')])
+        self.assertEqual(list(trie._root.children['s'].children['t'].children), ['a'])
+        trie.remove(1)
+        self.assertEqual(trie._root.children, {})
+        self.assertIsNone(trie.label(1))
+
+    def test_long_words_are_cut(self):
+        """Only MAX_DEPTH letters of a word are kept, and longer prefixes match on them."""
+        word = 'a' * MAX_DEPTH
+        trie = self.trie((1, word + 'bc', word + 'bc'))
+        depth, node = 0, trie._root
+        while node.children:
+            node = next(iter(node.children.values()))
+            depth = depth + 1
+        self.assertEqual(depth, MAX_DEPTH)
+        self.assertEqual(trie.suggest(word + 'b'), [(1, word + 'bc')])
+        self.assertEqual(trie.suggest(word + 'x'), [(1, word + 'bc')])
+
+    def test_suggestions_are_answered_while_the_trie_is_built(self):
+        """A new trie is built without the lock, and the changes made meanwhile are kept."""
+        trie = self.trie((1, 'Night', 'Night'))
+        found = []
+
+        def entries():
+            suggester = threading.Thread(target=lambda: found.append(trie.suggest('ni')))
+            suggester.start()
+            suggester.join(5)
+            trie.add(3, 'Nine', 'Nine')
+            yield 1, 'Night', 'Night'
+            yield 2, 'Nile', 'Nile'
+
+        trie.fill(entries())
+        self.assertEqual(found, [[(1, 'Night')]])
+        self.assertEqual(trie.suggest('ni'), [(1, 'Night'), (2, 'Nile'), (3, 'Nine')])
+
+class ScheduleConflictsTests(TestCase):
+    """Checks of the saved schedule, for a week or for a batch of new shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.screen = create_screen(create_theater())
+        cls.movie = create_movie(duration=120)
+
+    def test_show_of_the_day_before_is_checked(self):
+        """A show that runs past midnight conflicts with an early show of the first day checked."""
+        late = create_show(self.movie, self.screen, program(DAY - datetime.timedelta(1), 23))
+        early = create_show(self.movie, self.screen, program(DAY, 0, 30))
+        conflicts = schedule_conflicts(DAY, DAY + datetime.timedelta(6))
+        self.assertEqual(
+            [(first.show_id, second.show_id) for first, second in conflicts[self.screen.id]],
+            [(late.id, early.id)])
+
+    def test_conflicts_before_the_first_day_are_not_reported(self):
+        """Two shows that overlap the day before the checked range are left out."""
+        before = DAY - datetime.timedelta(1)
+        create_show(self.movie, self.screen, program(before, 18))
+        create_show(self.movie, self.screen, program(before, 19))
+        self.assertEqual(schedule_conflicts(DAY, DAY + datetime.timedelta(6)), {})
+
+    def test_batch_is_checked_against_itself_and_the_saved_shows(self):
+        """New showtimes conflict with saved shows and with each other, saved ones are not listed."""
+        create_show(self.movie, self.screen, program(DAY, 20))
+        create_show(self.movie, self.screen, program(DAY, 21))
+        new = [
+            show_interval(DAY, datetime.time(21, 30), 120, line=2),
+            show_interval(DAY + datetime.timedelta(1), datetime.time(10), 120, line=3),
+            show_interval(DAY + datetime.timedelta(1), datetime.time(11), 120, line=4),
+        ]
+        pairs = batch_conflicts({self.screen.id: new})[self.screen.id]
+        self.assertEqual(
+            sorted((first.line or 0, second.line or 0) for first, second in pairs),
+            [(0, 2), (0, 2), (3, 4)])
+
+    def test_batch_late_show_runs_into_the_next_day(self):
+        """A new late show conflicts with a saved show early the next day."""
+        create_show(self.movie, self.screen, program(DAY + datetime.timedelta(1), 0, 30))
+        new = [show_interval(DAY, datetime.time(23), 120, line=1)]
+        self.assertIn(self.screen.id, batch_conflicts({self.screen.id: new}))
+
+class ShowFormTests(TestCase):
+    """The schedule checks of the form that adds a show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.screen = create_screen(create_theater())
+        cls.movie = create_movie(duration=120)
+        cls.show = create_show(cls.movie, cls.screen, program(DAY, 20))
+
+    def form(self, *programs, instance=None, screen=None):
+        return ShowForm(data={
+            'movie': self.movie.id, 'theater': self.screen.theater.id,
+            'screen': (screen or self.screen).id, 'price': 9,
+            'program': [prog.id for prog in programs],
+        }, instance=instance)
+
+    def test_same_hour(self):
+        form = self.form(program(DAY, 20))
+        self.assertFalse(form.is_valid())
+        self.assertIn('Screen is reserved for same day and same hour', form.non_field_errors())
+
+    def test_overlap(self):
+        form = self.form(program(DAY, 21))
+        self.assertFalse(form.is_valid())
+        self.assertIn('Movie overlaps with another movie.', form.non_field_errors())
+
+    def test_overlap_between_the_new_programs(self):
+        """The programs of the new show are checked against each other too."""
+        form = self.form(program(DAY, 10), program(DAY, 11))
+        self.assertFalse(form.is_valid())
+        self.assertIn('Movie overlaps with another movie.', form.non_field_errors())
+
+    def test_past_midnight(self):
+        """A show the day after is refused if the late show of the day before still runs."""
+        late = program(DAY, 23)
+        self.assertTrue(self.form(late).is_valid())
+        create_show(self.movie, self.screen, late)
+        self.assertFalse(self.form(program(DAY + datetime.timedelta(1), 1)).is_valid())
+        self.assertTrue(self.form(program(DAY + datetime.timedelta(1), 2)).is_valid())
+
+    def test_editing_a_show_ignores_its_own_programs(self):
+        self.assertTrue(self.form(program(DAY, 20), instance=self.show).is_valid())
+
+    def test_other_screen_is_free(self):
+        other = create_screen(self.screen.theater)
+        self.assertTrue(self.form(program(DAY, 20), screen=other).is_valid())
+
+class ProgramViewTests(TestCase):
+    """The program page is built with a fixed number of queries, whatever the number of shows."""
+
+    def setUp(self):
+        cache.clear()
+
+    def add_shows(self, count):
+        """Adds a theater with count shows of different movies on the next days."""
+        screen = create_screen(create_theater(f"Theater {Theater.objects.count()}"))
+        today = timezone.localdate()
+        for number in range(count):
+            create_show(create_movie(f"Movie {Movie.objects.count()}"), screen,
+                        program(today + datetime.timedelta(number), 10),
+                        program(today + datetime.timedelta(number), 20))
+
+    def test_queries_do_not_grow_with_the_shows(self):
+        self.add_shows(1)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies:program'))
+        self.assertContains(response, 'Movie 0')
+
+        self.add_shows(5)
+        self.add_shows(5)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies:program'))
+        self.assertContains(response, 'Theater 2')
+        self.assertContains(response, 'Movie 10')
+
+    def test_cached_schedule_needs_no_query(self):
+        self.add_shows(3)
+        self.client.get(reverse('movies:program'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('movies:program'))
+
+    def test_movies_with_the_same_name(self):
+        """Two movies with the same name at a theater are listed apart, each with its hours."""
+        screen = create_screen(create_theater())
+        day = timezone.localdate() + datetime.timedelta(1)
+        original = create_show(create_movie('Solaris'), screen, program(day, 10), program(day, 20))
+        remake = create_show(create_movie('Solaris'), screen, program(day, 15))
+        movies = catalog.schedule()[0]['movies']
+        self.assertEqual(
+            [(movie['id'], [hour.hour for hour in movie['days'][0]['hours']]) for movie in movies],
+            [(original.movie_id, [10, 20]), (remake.movie_id, [15])])
+
+    def test_new_show_is_listed_at_once(self):
+        """A saved show drops the cached schedule."""
+        self.add_shows(1)
+        self.client.get(reverse('movies:program'))
+        self.add_shows(1)
+        self.assertContains(self.client.get(reverse('movies:program')), 'Movie 1')
+
+class ImportScheduleTests(TestCase):
+    """The two passes of the schedule import: the validation of the file, then the chunks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.screen = create_screen(create_theater())
+        cls.movie = create_movie(duration=120)
+        cls.seats = Seat.objects.filter(screen=cls.screen).count()
+
+    def schedule_file(self, *days, price=9):
+        """Writes a CSV file with a showtime of the movie at 20:00 on each day."""
+        data = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        with data:
+            data.write('movie,screen,day,hour,price\n')
+            for day in days:
+                data.write(f"{self.movie.id},{self.screen.id},{day:%Y-%m-%d},20:00,{price}\n")
+        self.addCleanup(os.remove, data.name)
+        return data.name
+
+    def run_import(self, path, *args):
+        """Runs the import in chunks of two showtimes and returns what it wrote to stderr."""
+        errors = io.StringIO()
+        call_command('import_schedule', path, '--chunk-size=2', *args,
+                     stdout=io.StringIO(), stderr=errors)
+        return errors.getvalue()
+
+    def days(self, count):
+        return [DAY + datetime.timedelta(number) for number in range(count)]
+
+    def assertImported(self, showtimes):
+        """Checks that every showtime has a program, a seat map and the seats of the screen."""
+        self.assertEqual(Show.program.through.objects.count(), showtimes)
+        self.assertEqual(SeatMap.objects.count(), showtimes)
+        self.assertEqual(ShowSeat.objects.count(), showtimes * self.seats)
+
+    def test_import(self):
+        """The showtimes of a movie on a screen at a price become one show per chunk."""
+        self.run_import(self.schedule_file(*self.days(3)))
+        self.assertEqual(Show.objects.count(), 2)
+        self.assertImported(3)
+
+    def test_dry_run_writes_nothing(self):
+        self.run_import(self.schedule_file(*self.days(3)), '--dry-run')
+        self.assertFalse(Show.objects.exists())
+
+    def test_invalid_line_writes_nothing(self):
+        path = self.schedule_file(DAY, price=20)
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+        self.assertFalse(Show.objects.exists())
+
+    def test_overlap_with_a_scheduled_show(self):
+        create_show(self.movie, self.screen, program(DAY, 21))
+        with self.assertRaises(CommandError):
+            self.run_import(self.schedule_file(*self.days(3)))
+        self.assertEqual(Show.objects.count(), 1)
+
+    def test_catalog_is_dropped_once(self):
+        """The shows saved one by one do not drop the cached catalog each."""
+        catalog.invalidate()
+        version = cache.get(catalog.VERSION_KEY)
+        self.run_import(self.schedule_file(*self.days(3)))
+        self.assertEqual(cache.get(catalog.VERSION_KEY), version + 1)
+
+    def test_failed_chunk_is_removed_and_the_import_resumed(self):
+        """Without a rollback, the shows of a failed chunk are deleted, and a second run resumes."""
+        path = self.schedule_file(*self.days(5))
+        inserts = []
+
+        def failing_insert(model, objs):
+            inserts.append(model)
+            if inserts.count(SeatMap) == 2:
+                raise RuntimeError('insert failed')
+            return bulk_insert(model, objs)
+
+        bulk_insert = import_schedule.bulk_insert
+        # As on djongo, the chunk's transaction does not roll anything back.
+        no_rollback = mock.Mock(atomic=contextlib.nullcontext)
+        with mock.patch.object(import_schedule, 'transaction', no_rollback), \
+                mock.patch.object(import_schedule, 'bulk_insert', failing_insert):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path)
+        self.assertEqual(Show.objects.count(), 1)
+        self.assertImported(2)
+
+        # The showtimes of the first chunk now overlap the file itself.
+        with self.assertRaises(CommandError):
+            self.run_import(path)
+        self.run_import(path, '--skip-existing')
+        self.assertEqual(Show.objects.count(), 3)
+        self.assertImported(5)
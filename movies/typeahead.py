@@ -0,0 +1,222 @@
+"""
+The following tries suggest movies by name and theaters by name, city and county while
+the user types, for the movie and theater pickers of the booking pages. Every node of a
+trie keeps the entries that have a word starting with its prefix, so a suggestion costs one
+walk down the trie per typed word, whatever the number of movies and theaters.
+Words are compared without case and accents, like in the search index. The tries are built
+on first use, updated from the signals of Movie and Theater, and rebuilt every RELOAD_AFTER
+seconds so that changes made by other processes are picked up. Like the search index, a new
+trie is built without holding the lock of the one in use and swapped in once complete, and
+a rebuild runs in a background thread while the current trie keeps suggesting.
+"""
+
+import time
+import heapq
+import threading
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from .models import Movie, Theater
+from .search import normalize, words
+
+# Seconds after which a trie is built again from the database.
+RELOAD_AFTER = 10*60
+
+# Only the first letters of a word are kept in the trie; longer prefixes match on them.
+MAX_DEPTH = 16
+
+class Node:
+    """A node of a trie: its children by letter and the ids of the entries below it."""
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = set()
+
+class PrefixTrie:
+    """Trie of the words of labelled entries, loaded with a function that yields them."""
+
+    def __init__(self, entries):
+        self._entries_from_database = entries
+        self._lock = threading.RLock()
+        # Held by the thread that builds a new trie, so that only one is built at a time.
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        # The changes made while a new trie is built, to be applied to it as well.
+        self._pending = None
+        self.clear()
+
+    @property
+    def loaded(self):
+        """Whether the trie has been built from the database."""
+        return self._loaded_at is not None
+
+    def clear(self):
+        """Empties the trie."""
+        with self._lock:
+            self._root = Node()
+            self._labels = {}
+            self._words = {}
+
+    def load(self):
+        """Builds the trie from the entries of the database."""
+        self.fill(self._entries_from_database())
+
+    def fill(self, entries):
+        """
+        Replaces the trie with (id, label, text) entries; label is shown, text is matched.
+        The new trie is built apart and swapped in, with the changes made meanwhile applied to it.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            built = PrefixTrie(self._entries_from_database)
+            for entry_id, label, text in entries:
+                built.add(entry_id, label, text)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for method, args in self._pending:
+                getattr(built, method)(*args)
+            self._pending = None
+            self._root, self._labels, self._words = built._root, built._labels, built._words
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        """
+        Builds the trie on first use, which the suggestions wait for, and starts building it
+        again in a background thread once it is older than RELOAD_AFTER, suggesting from it meanwhile.
+        """
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+        elif (time.monotonic() - self._loaded_at > RELOAD_AFTER
+              and self._load_lock.acquire(blocking=False)):
+            threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        """Builds the trie again, in the background thread started by _ensure_loaded."""
+        try:
+            self.load()
+        finally:
+            self._load_lock.release()
+            connection.close()
+
+    def _record(self, method, *args):
+        """Keeps a change to apply it to the trie being built, if there is one."""
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def add(self, entry_id, label, text):
+        """Adds an entry to the trie, or updates it."""
+        with self._lock:
+            self._record('add', entry_id, label, text)
+            self._remove(entry_id)
+            self._labels[entry_id] = label
+            self._words[entry_id] = {word[:MAX_DEPTH] for word in words(text)}
+            for word in self._words[entry_id]:
+                node = self._root
+                for letter in word:
+                    node = node.children.setdefault(letter, Node())
+                    node.ids.add(entry_id)
+
+    def remove(self, entry_id):
+        """Removes an entry from the trie, and the nodes left without entries."""
+        with self._lock:
+            self._record('remove', entry_id)
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        """Removes an entry, without keeping the change for a trie being built."""
+        self._labels.pop(entry_id, None)
+        for word in self._words.pop(entry_id, ()):
+            # Words of the same entry may share nodes that were pruned already.
+            path = [self._root]
+            for letter in word:
+                node = path[-1].children.get(letter)
+                if node is None:
+                    break
+                node.ids.discard(entry_id)
+                path.append(node)
+            for depth in range(len(path) - 1, 0, -1):
+                if path[depth].ids:
+                    break
+                del path[depth - 1].children[word[depth - 1]]
+
+    def _find(self, prefix):
+        """Returns the ids of the entries with a word starting with a prefix."""
+        node = self._root
+        for letter in prefix[:MAX_DEPTH]:
+            node = node.children.get(letter)
+            if node is None:
+                return set()
+        return node.ids
+
+    def label(self, entry_id):
+        """Returns the label of an entry, or None if it is not in the trie."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._labels.get(entry_id)
+
+    def suggest(self, query, allowed=None, limit=10):
+        """
+        Returns the (id, label) of the entries with a word starting with every word of a query,
+        only among the allowed ids if given. Labels that start with the query come first,
+        then the others, in alphabetical order.
+        """
+        prefixes = words(query)
+        if not prefixes:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            matches = [self._find(prefix) for prefix in prefixes]
+            if allowed is not None:
+                matches.append(set(allowed))
+            # Intersecting from the smallest set keeps short prefixes cheap.
+            matches.sort(key=len)
+            ids = matches[0].intersection(*matches[1:])
+            start = normalize(query.strip())
+            labels = {entry_id: normalize(self._labels[entry_id]) for entry_id in ids}
+            best = heapq.nsmallest(limit, ids, key=lambda entry_id: (
+                not labels[entry_id].startswith(start), labels[entry_id], entry_id))
+            return [(entry_id, self._labels[entry_id]) for entry_id in best]
+
+def _movie_entry(movie_id, name):
+    return movie_id, name, name
+
+def _theater_entry(theater_id, name, city, county):
+    return theater_id, f"{name}, {city}", f"{name} {city} {county}"
+
+movies = PrefixTrie(lambda: (_movie_entry(*movie)
+                             for movie in Movie.objects.values_list('id', 'name').iterator()))
+theaters = PrefixTrie(lambda: (_theater_entry(*theater)
+                               for theater in Theater.objects.values_list(
+                                   'id', 'name', 'city', 'county').iterator()))
+
+def update_movie(sender, instance, **kwargs):
+    """Updates the name of a saved movie."""
+    if movies.loaded:
+        movies.add(*_movie_entry(instance.id, instance.name))
+
+def remove_movie(sender, instance, **kwargs):
+    """Removes a deleted movie."""
+    if movies.loaded:
+        movies.remove(instance.id)
+
+def update_theater(sender, instance, **kwargs):
+    """Updates the name, city and county of a saved theater."""
+    if theaters.loaded:
+        theaters.add(*_theater_entry(instance.id, instance.name, instance.city, instance.county))
+
+def remove_theater(sender, instance, **kwargs):
+    """Removes a deleted theater."""
+    if theaters.loaded:
+        theaters.remove(instance.id)
+
+post_save.connect(update_movie, sender=Movie)
+post_delete.connect(remove_movie, sender=Movie)
+post_save.connect(update_theater, sender=Theater)
+post_delete.connect(remove_theater, sender=Theater)
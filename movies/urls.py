@@ -15,15 +15,12 @@ Including another URLconf
 """
 
 from django.urls import path
-from django.conf.urls.static import static
-from django.conf import settings
 from . import views
 
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('single<id>/', views.single_view, name='single'),
     path('program/', views.program_view, name='program'),
+    path('search/', views.search_view, name='search'),
 
 ]
-
-urlpatterns = urlpatterns + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,43 +1,50 @@
 """
 The following views handle movie-related functions, including
 displaying movies on the homepage, showing details about a single movie,
-and listing the schedule of the movies that are played.
+listing the schedule of the movies that are played and searching for movies.
 """
 
+from django.http import Http404
 from django.shortcuts import render
-from django.utils.timezone import datetime
-from .models import Show, Movie, Theater
+from . import catalog, related, search
+from .models import Movie
+
+# Most movies shown for a search.
+SEARCH_RESULTS = 30
 
 def home_view(request):
     """Finds the movies that are currently played and renders the homepage template."""
-    today = datetime.now().date()
-    current_shows = Show.objects.filter(program__day__gte=today)
-    current_movies = Movie.objects.filter(id__in=current_shows)
-    context = {'current_movies': current_movies}
+    context = {'current_movies': catalog.showing()}
     return render(request, 'movies/home.html', context)
 
 def single_view(request, id):
     """
-    Finds movies that belong to the same genre as the selected movie
+    Finds movies that belong to the same genres as the selected movie
     to suggest to the user and passes them to the template.
     """
 
-    related_movies_list = []
-    movie = Movie.objects.get(id=id)
-
-    for genre in movie.genre.all():
-        related_movies = Movie.objects.filter(genre=genre).exclude(id=id)
-        for temp in related_movies:
-            if temp not in related_movies_list:
-                related_movies_list.append(temp)
+    try:
+        movie_id = int(id)
+    except ValueError:
+        raise Http404('Movie does not exist.')
+    related_ids = related.index.related(movie_id)
+    movies = Movie.objects.in_bulk([movie_id] + related_ids)
+    if movie_id not in movies:
+        raise Http404('Movie does not exist.')
 
-    context = {'movie': movie, 'related_movies':related_movies_list[:6]}
+    related_movies_list = [movies[other] for other in related_ids if other in movies]
+    context = {'movie': movies[movie_id], 'related_movies': related_movies_list}
     return render(request, 'single.html', context)
 
 def program_view(request):
     """Finds the schedule of the movies that are played in theaters."""
-    today = datetime.now().date()
-    theaters = Theater.objects.all().order_by('city')
-    current_shows = Show.objects.filter(program__day__gte=today).distinct()
-    context = {'theaters':theaters, 'shows': current_shows}
+    context = {'theaters': catalog.schedule()}
     return render(request, 'movies/program.html', context)
+
+def search_view(request):
+    """Finds the movies that match the words of the query, best first."""
+    query = request.GET.get('q', '').strip()
+    ids = search.index.search(query, limit=SEARCH_RESULTS) if query else []
+    movies = Movie.objects.prefetch_related('genre').in_bulk(ids)
+    context = {'query': query, 'movies': [movies[movie_id] for movie_id in ids if movie_id in movies]}
+    return render(request, 'movies/search.html', context)
@@ -0,0 +1,255 @@
+"""
+The following storage and views serve the static and media files efficiently. In the production
+ASSET_MODE, collectstatic stores every static file under a name that contains a hash of its
+content, next to a gzip copy (and a brotli one, if the brotli package is installed), so that
+nothing is compressed while a page is served and the files can be cached for ever.
+The views pick the smallest copy the browser accepts, answer range and conditional requests,
+and only serve media from the upload directories of MEDIA_DIRS. Media files can be handed
+to the web server in front of Django with X-Accel-Redirect or X-Sendfile (MEDIA_SENDFILE),
+which sends them straight from the disk; otherwise they are sent with a FileResponse, which
+WSGI servers such as gunicorn and uWSGI also send with sendfile.
+"""
+
+import io
+import os
+import re
+import gzip
+import posixpath
+import mimetypes
+from urllib.parse import unquote, urlsplit
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from movies.images import VARIANT_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth compressing; images and fonts such as woff are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico',
+                '.ttf', '.otf', '.eot')
+
+# Encodings of the precompressed copies, best first, with the extension of their files.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli is not None else [('gzip', '.gz')]
+
+# A year, the longest max-age browsers are expected to honour.
+FOREVER = 365 * 24 * 60 * 60
+
+def _gzip(data):
+    output = io.BytesIO()
+    # mtime is fixed so that the same file always gives the same copy.
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0) as compressed:
+        compressed.write(data)
+    return output.getvalue()
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+COMPRESSORS = {'gzip': _gzip, 'br': _brotli}
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Stores the static files under hashed names, like ManifestStaticFilesStorage, and writes
+    a precompressed copy of every compressible file that is at least 5% smaller.
+    """
+    # Pages that refer to a missing file keep its plain name instead of failing.
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        # The stylesheets of the templates refer to some files that are not shipped,
+        # e.g. fonts; their URLs are left as they are instead of failing collectstatic.
+        if content is None and not self.exists(urlsplit(unquote(filename or name)).path.strip()):
+            return name
+        return super().hashed_name(name, content, filename)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """Writes the precompressed copies of a stored file that are worth keeping."""
+        path = self.path(name)
+        with open(path, 'rb') as original:
+            data = original.read()
+        for encoding, extension in ENCODINGS:
+            compressed = COMPRESSORS[encoding](data)
+            if len(compressed) < len(data) * 0.95:
+                with open(path + extension, 'wb') as output:
+                    output.write(compressed)
+            elif os.path.exists(path + extension):
+                os.remove(path + extension)
+
+class FileRange:
+    """The bytes of an open file from start on, length of them, read like a file."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining = self.remaining - len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def byte_range(header, size):
+    """
+    Returns the (start, length) of a Range header over a file of the given size, None if the
+    whole file should be sent instead, or False if the range cannot be satisfied.
+    Only single ranges are supported; a request for several gets the whole file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N asks for the last N bytes.
+        length = min(int(last), size)
+        return (size - length, length) if length else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+def _accepts(request, encoding):
+    """Returns whether the Accept-Encoding of a request allows the given encoding."""
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        token, _, params = coding.strip().partition(';')
+        if token.strip().lower() == encoding:
+            quality = params.strip().partition('=')[2] if params.strip().startswith('q=') else '1'
+            try:
+                return float(quality) > 0
+            except ValueError:
+                return False
+    return False
+
+def _resolve(document_root, path):
+    """Returns the absolute path of a file under a directory, or raises Http404."""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return path, fullpath
+
+def serve_file(request, fullpath, cache_control, sendfile=None, sendfile_name=None):
+    """
+    Returns the response that sends a file with the given Cache-Control: 304 if the browser
+    has it already, 206 with the requested bytes for a range request, otherwise the smallest
+    precompressed copy the browser accepts. With sendfile, only the headers are returned and
+    the web server sends sendfile_name itself.
+    """
+    stat = os.stat(fullpath)
+    last_modified = http_date(stat.st_mtime)
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+        response['Cache-Control'] = cache_control
+        return response
+
+    if sendfile == 'x-accel-redirect':
+        # nginx answers range requests itself.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = sendfile_name
+    elif sendfile == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+    else:
+        response = _file_response(request, fullpath, stat.st_size, content_type, last_modified)
+        if encoding and 'Content-Encoding' not in response:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control
+    return response
+
+def _file_response(request, fullpath, size, content_type, last_modified):
+    """Returns a FileResponse with the requested range or the best encoding of a file."""
+    compressible = fullpath.endswith(COMPRESSIBLE)
+    header = request.META.get('HTTP_RANGE')
+    # A range of a file that changed since the browser got its first part is not sent.
+    if header and request.META.get('HTTP_IF_RANGE', last_modified) == last_modified:
+        requested = byte_range(header, size)
+        if requested is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        if requested is not None:
+            start, length = requested
+            response = FileResponse(FileRange(open(fullpath, 'rb'), start, length),
+                                    status=206, content_type=content_type)
+            response['Content-Length'] = length
+            response['Content-Range'] = f"bytes {start}-{start + length - 1}/{size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    response = None
+    if compressible:
+        for encoding, extension in ENCODINGS:
+            if _accepts(request, encoding) and os.path.isfile(fullpath + extension):
+                response = FileResponse(open(fullpath + extension, 'rb'), content_type=content_type)
+                response['Content-Encoding'] = encoding
+                break
+    if response is None:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+        # Ranges are only offered on the identity encoding.
+        response['Accept-Ranges'] = 'bytes'
+    if compressible:
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
+def _immutable_static():
+    """Returns the names of the hashed static files, which never change."""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None) or {}
+    return set(hashed_files.values())
+
+def static_view(request, path):
+    """
+    Serves a collected static file in the production ASSET_MODE, for deployments where no
+    web server serves STATIC_ROOT. Hashed files are cached for ever.
+    """
+    path, fullpath = _resolve(settings.STATIC_ROOT, path)
+    if path in _immutable_static():
+        cache_control = f"public, max-age={FOREVER}, immutable"
+    else:
+        cache_control = f"public, max-age={settings.ASSET_MAX_AGE}"
+    return serve_file(request, fullpath, cache_control)
+
+def media_view(request, path):
+    """
+    Serves an uploaded file from one of the MEDIA_DIRS, nothing else under MEDIA_ROOT.
+    The poster variants are named after their content, so they are cached for ever.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if not path.startswith(tuple(settings.MEDIA_DIRS)):
+        raise Http404
+    path, fullpath = _resolve(settings.MEDIA_ROOT, path)
+    if path.startswith(VARIANT_DIR + '/'):
+        cache_control = f"public, max-age={FOREVER}, immutable"
+    else:
+        cache_control = f"public, max-age={settings.ASSET_MAX_AGE}"
+    return serve_file(request, fullpath, cache_control, settings.MEDIA_SENDFILE,
+                      settings.MEDIA_ACCEL_PREFIX + path)
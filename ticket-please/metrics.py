@@ -0,0 +1,125 @@
+"""
+The following middleware and view measure the requests of every view: wall time, number
+of database queries, database time and response size. Each process keeps the last
+METRICS_WINDOW measurements of every view, from which the percentiles are computed,
+and logs every measurement as one line of JSON at INFO. Only a METRICS_SAMPLE_RATE fraction
+of the requests is measured, so that the overhead can be kept small in production.
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+from collections import defaultdict, deque
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection
+from django.http import JsonResponse
+from movies import catalog
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('wall_ms', 'queries', 'db_ms', 'bytes')
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class Metrics:
+    """The last measurements of every view, and the number of requests measured."""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: {field: deque(maxlen=self.window) for field in FIELDS})
+        self._counts = defaultdict(int)
+
+    def record(self, view, **measurement):
+        """Adds the measurement of a request to a view."""
+        with self._lock:
+            samples = self._samples[view]
+            for field in FIELDS:
+                samples[field].append(measurement[field])
+            self._counts[view] = self._counts[view] + 1
+
+    def snapshot(self):
+        """Returns the number of requests and the p50, p95 and p99 of every field, per view."""
+        with self._lock:
+            samples = {view: {field: list(values) for field, values in fields.items()}
+                       for view, fields in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            view: dict({'requests': counts[view]}, **{
+                field: {name: percentile(values, fraction)
+                        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))}
+                for field, values in fields.items()
+            })
+            for view, fields in sorted(samples.items())
+        }
+
+    def clear(self):
+        """Forgets every measurement."""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+metrics = Metrics(settings.METRICS_WINDOW)
+
+class QueryTimer:
+    """Database execute wrapper that counts the queries of a request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count = self.count + 1
+            self.time = self.time + time.perf_counter() - start
+
+class MetricsMiddleware:
+    """Measures a METRICS_SAMPLE_RATE fraction of the requests and records them per view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.METRICS_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        wall = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        measurement = {
+            'wall_ms': round(wall * 1000, 3),
+            'queries': timer.count,
+            'db_ms': round(timer.time * 1000, 3),
+            # Streamed responses are still being sent, so their size is unknown.
+            'bytes': 0 if response.streaming else len(response.content),
+        }
+        metrics.record(view, **measurement)
+        logger.info(json.dumps(dict(
+            {'view': view, 'method': request.method, 'status': response.status_code},
+            **measurement)))
+        return response
+
+@staff_member_required
+def metrics_view(request):
+    """Returns the percentiles of every view of this process and the catalog cache hits as JSON."""
+    return JsonResponse({
+        'sample_rate': settings.METRICS_SAMPLE_RATE,
+        'window': metrics.window,
+        'views': metrics.snapshot(),
+        'catalog_cache': catalog.stats(),
+    })
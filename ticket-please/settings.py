@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
-from decouple import config
+from decouple import config, Choices
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'ticket-please.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,12 +81,74 @@ WSGI_APPLICATION = 'ticket-please.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'djongo',
-        'NAME': 'Cluster0',
+# DB_BACKEND selects the database: djongo (MongoDB, the default), sqlite or postgresql.
+# The relational backends run the same apps and migrations.
+DB_BACKEND = config('DB_BACKEND', default='djongo')
+
+if DB_BACKEND == 'djongo':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'djongo',
+            'NAME': config('DB_NAME', default='Cluster0'),
+        }
+    }
+elif DB_BACKEND == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=os.path.join(BASE_DIR, 'db.sqlite3')),
+            # Writers wait for each other instead of failing at once. The test database is
+            # a file rather than in memory, so the concurrency tests can wait on its locks.
+            'OPTIONS': {'timeout': 20},
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+        }
+    }
+elif DB_BACKEND == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='ticket_please'),
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default=''),
+            'PORT': config('DB_PORT', default=''),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        f"Unknown DB_BACKEND {DB_BACKEND!r}, expected djongo, sqlite or postgresql.")
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# The catalog, the seat states and the cache sessions must be seen by every worker process,
+# so CACHE_BACKEND must be a shared cache: memcached (needs python-memcached, CACHE_LOCATION is
+# host:port) or file (shared by the processes of one host, CACHE_LOCATION is a directory).
+# locmem is private to each process, and only fits a single process, e.g. the tests.
+CACHE_BACKEND = config('CACHE_BACKEND', default='file',
+                       cast=Choices(['memcached', 'file', 'locmem']))
+
+if CACHE_BACKEND == 'memcached':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': config('CACHE_LOCATION', default='127.0.0.1:11211'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION', default='/var/tmp/ticket-please-cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -126,3 +190,80 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_ROOT = (BASE_DIR)
 MEDIA_URL = '/media/'
+
+# ASSET_MODE production stores the collected static files under hashed names, with gzip
+# (and brotli, if installed) copies, and serves them with far-future cache headers.
+ASSET_MODE = config('ASSET_MODE', default='debug', cast=Choices(['debug', 'production']))
+if ASSET_MODE == 'production':
+    STATICFILES_STORAGE = 'ticket-please.assets.CompressedManifestStaticFilesStorage'
+
+# Seconds browsers may cache the static and media files whose names do not change with them.
+ASSET_MAX_AGE = config('ASSET_MAX_AGE', default=3600, cast=int)
+
+# The directories of MEDIA_ROOT that hold uploads. Nothing else under it is served.
+MEDIA_DIRS = ('img/',)
+
+# How media files are sent: by Django (django), or by the web server in front of it with
+# X-Accel-Redirect (nginx, from an internal location at MEDIA_ACCEL_PREFIX) or X-Sendfile.
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='django',
+                        cast=Choices(['django', 'x-accel-redirect', 'x-sendfile']))
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# Minutes a seat stays held for a user between seat selection and payment.
+SEAT_HOLD_MINUTES = config('SEAT_HOLD_MINUTES', default=10, cast=int)
+
+# Class that fans out the seat changes to the open seat pages. LocalBroadcaster only
+# reaches the pages served by the same process.
+SEAT_BROADCASTER = config('SEAT_BROADCASTER', default='cart.broadcast.LocalBroadcaster')
+
+# Whether seat pages get the seat changes pushed as server-sent events. Every open stream holds
+# a worker (or thread) of the server for as long as the page is open, so this needs a server
+# with many cheap workers, e.g. gunicorn with gevent workers or threads (see README).
+# Without it, the seat pages poll the seat map, which is answered from the cache.
+SEAT_EVENTS = config('SEAT_EVENTS', default=False, cast=bool)
+
+# Most seat event streams a process keeps open at once, below its number of threads so that
+# the other pages are still served. The seat pages that are refused poll the seat map instead.
+SEAT_EVENTS_MAX_STREAMS = config('SEAT_EVENTS_MAX_STREAMS', default=20, cast=int)
+
+# Seconds between the keepalive comments of an idle seat event stream.
+SEAT_EVENTS_KEEPALIVE = config('SEAT_EVENTS_KEEPALIVE', default=15, cast=int)
+
+# Seconds the seat states of a show's program stay cached if its seat map does not change.
+SEAT_MAP_CACHE_TIMEOUT = config('SEAT_MAP_CACHE_TIMEOUT', default=60, cast=int)
+
+# Fraction of the requests measured by the metrics middleware, between 0 (off) and 1 (all).
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=1.0, cast=float)
+
+# Number of measurements kept per view for the percentiles.
+METRICS_WINDOW = config('METRICS_WINDOW', default=1000, cast=int)
+
+# The metrics middleware logs every measurement as a line of JSON at INFO,
+# which METRICS_LOG_LEVEL=INFO shows.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'ticket-please.metrics': {
+            'handlers': ['console'],
+            'level': config('METRICS_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# SESSION_BACKEND selects where sessions are kept: db (the default), cache, cached_db
+# or signed_cookies. With cache or signed_cookies, reading the session needs no query.
+# cache and cached_db need a cache shared by all the workers, otherwise the session, and the
+# booking kept in it, would be lost whenever a request reaches another worker.
+SESSION_BACKEND = config('SESSION_BACKEND', default='db',
+                         cast=Choices(['db', 'cache', 'cached_db', 'signed_cookies']))
+if SESSION_BACKEND in ('cache', 'cached_db') and CACHE_BACKEND == 'locmem':
+    raise ImproperlyConfigured(
+        f"SESSION_BACKEND {SESSION_BACKEND} needs a shared CACHE_BACKEND, not locmem.")
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + SESSION_BACKEND
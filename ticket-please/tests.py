@@ -0,0 +1,193 @@
+"""The following tests cover the metrics of the requests and the media files served by Django."""
+
+import os
+import gzip
+import json
+import shutil
+import tempfile
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+from .assets import byte_range
+from .metrics import Metrics, metrics
+
+class MetricsTests(SimpleTestCase):
+    """The percentiles kept for every view."""
+
+    def record(self, store, view, *values):
+        for value in values:
+            store.record(view, wall_ms=value, queries=value, db_ms=value, bytes=value)
+
+    def test_percentiles(self):
+        store = Metrics(window=1000)
+        self.record(store, 'movies:program', *range(1, 101))
+        snapshot = store.snapshot()['movies:program']
+        self.assertEqual(snapshot['requests'], 100)
+        self.assertEqual(snapshot['queries'], {'p50': 51, 'p95': 96, 'p99': 100})
+
+    def test_window(self):
+        """Only the last measurements count, but every request is counted."""
+        store = Metrics(window=10)
+        self.record(store, 'home', *[1000] * 10, *[1] * 10)
+        snapshot = store.snapshot()['home']
+        self.assertEqual(snapshot['requests'], 20)
+        self.assertEqual(snapshot['wall_ms']['p99'], 1)
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsMiddlewareTests(TestCase):
+    """The requests measured by the middleware, and the page that shows them."""
+
+    def setUp(self):
+        metrics.clear()
+        cache.clear()
+
+    def test_measurement(self):
+        """A request records its queries, database time and size under its view name."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies:program'))
+        snapshot = metrics.snapshot()
+        self.assertEqual(list(snapshot), ['movies:program'])
+        self.assertEqual(snapshot['movies:program']['requests'], 1)
+        self.assertEqual(snapshot['movies:program']['queries']['p50'], 1)
+        self.assertGreaterEqual(snapshot['movies:program']['db_ms']['p50'], 0)
+        self.assertEqual(snapshot['movies:program']['bytes']['p50'], len(response.content))
+
+    def test_log_line(self):
+        with self.assertLogs('ticket-please.metrics', 'INFO') as logs:
+            self.client.get(reverse('movies:program'))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['view'], line['method'], line['status']), ('movies:program', 'GET', 200))
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sample_rate_zero(self):
+        self.client.get(reverse('movies:program'))
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_unresolved(self):
+        """Requests that match no view are recorded together."""
+        self.client.get('/no-such-page/')
+        self.assertEqual(list(metrics.snapshot()), ['unresolved'])
+
+    def test_metrics_page_is_for_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sample_rate'], 1)
+        self.assertIn('metrics', response.json()['views'])
+
+class ByteRangeTests(SimpleTestCase):
+    """The Range headers that are answered with part of a file, the whole file or a 416."""
+
+    def test_ranges(self):
+        self.assertEqual(byte_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(byte_range('bytes=90-', 100), (90, 10))
+        self.assertEqual(byte_range('bytes=90-500', 100), (90, 10))
+        self.assertEqual(byte_range(' bytes=99-99 ', 100), (99, 1))
+
+    def test_suffix(self):
+        """bytes=-N is the last N bytes, or the whole file if it is shorter."""
+        self.assertEqual(byte_range('bytes=-10', 100), (90, 10))
+        self.assertEqual(byte_range('bytes=-500', 100), (0, 100))
+        self.assertIs(byte_range('bytes=-0', 100), False)
+
+    def test_unsatisfiable(self):
+        self.assertIs(byte_range('bytes=100-', 100), False)
+        self.assertIs(byte_range('bytes=10-5', 100), False)
+        self.assertIs(byte_range('bytes=0-', 0), False)
+
+    def test_whole_file(self):
+        """Headers that are not one byte range get the whole file."""
+        for header in ('bytes=-', 'bytes=0-1,5-6', 'items=0-1', 'bytes=a-b', ''):
+            self.assertIsNone(byte_range(header, 100), header)
+
+class MediaViewTests(SimpleTestCase):
+    """Only the upload directories are served, with ranges, encodings and the sendfile headers."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.root, 'img'))
+        cls.css = b'body { color: black; }\n' * 50
+        with open(os.path.join(cls.root, 'img', 'style.css'), 'wb') as data:
+            data.write(cls.css)
+        with open(os.path.join(cls.root, 'img', 'style.css.gz'), 'wb') as data:
+            data.write(gzip.compress(cls.css))
+        with open(os.path.join(cls.root, 'img', 'poster.jpg'), 'wb') as data:
+            data.write(b'0123456789')
+        with open(os.path.join(cls.root, 'settings.py'), 'wb') as data:
+            data.write(b'SECRET_KEY = "x"')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+        super().tearDownClass()
+
+    def get(self, path, **headers):
+        with self.settings(MEDIA_ROOT=self.root):
+            return self.client.get('/media/' + path, **headers)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_only_the_upload_directories(self):
+        self.assertEqual(self.get('img/poster.jpg').status_code, 200)
+        for path in ('settings.py', 'img/../settings.py', 'img/%2e%2e/settings.py',
+                     '/settings.py', 'img/missing.jpg', 'img/'):
+            self.assertEqual(self.get(path).status_code, 404, path)
+
+    def test_project_files_are_not_served(self):
+        """MEDIA_ROOT is the project directory, whose files stay private."""
+        for path in ('manage.py', 'img/../manage.py', 'img/../ticket-please/settings.py'):
+            self.assertEqual(self.client.get('/media/' + path).status_code, 404, path)
+
+    def test_range(self):
+        response = self.get('img/poster.jpg', HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(self.content(response), b'234')
+        response = self.get('img/poster.jpg', HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_gzip(self):
+        response = self.get('img/style.css', HTTP_ACCEPT_ENCODING='br, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(self.content(response)), self.css)
+
+        for accept in ('gzip;q=0', 'identity', ''):
+            response = self.get('img/style.css', HTTP_ACCEPT_ENCODING=accept)
+            self.assertNotIn('Content-Encoding', response, accept)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(self.content(response), self.css)
+
+        response = self.get('img/poster.jpg', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Vary', response)
+
+    def test_not_modified(self):
+        mtime = os.stat(os.path.join(self.root, 'img', 'poster.jpg')).st_mtime
+        response = self.get('img/poster.jpg', HTTP_IF_MODIFIED_SINCE=http_date(mtime))
+        self.assertEqual(response.status_code, 304)
+        response = self.get('img/poster.jpg', HTTP_IF_MODIFIED_SINCE=http_date(mtime - 60))
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile(self):
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.get('img/poster.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/img/poster.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get('img/poster.jpg')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'img', 'poster.jpg'))
+        self.assertEqual(response.content, b'')
@@ -16,9 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls import include
-from django.conf.urls.static import static
-from django.urls import path
+from django.urls import path, re_path
 from .import views
+from .metrics import metrics_view
+from .assets import media_view, static_view
 
 
 urlpatterns = [
@@ -26,7 +27,16 @@ urlpatterns = [
     path('accounts/', include(('accounts.urls', 'accounts'), namespace='accounts')),
     path('movies/', include(('movies.urls', 'movies'), namespace='movies')),
     path('cart/', include(('cart.urls', 'cart'), namespace='cart')),
+    path('metrics/', metrics_view, name='metrics'),
     path('', views.home_view, name='home'),
 ]
 
-urlpatterns = urlpatterns + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns = urlpatterns + [
+    re_path(r'^{}(?P<path>.*)$'.format(settings.MEDIA_URL.lstrip('/')), media_view, name='media'),
+]
+
+# Without a web server in front of Django, the collected static files are served here.
+if settings.ASSET_MODE == 'production':
+    urlpatterns = urlpatterns + [
+        re_path(r'^{}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')), static_view),
+    ]